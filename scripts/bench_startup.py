@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark de arranque del servidor MCP.
+
+Lanza src/launcher.py por stdio varias veces (como hace Claude Desktop) y mide:
+- Tiempo hasta la respuesta a 'initialize' (objetivo: < 150 ms)
+- Tiempo hasta la respuesta a 'tools/list' (SDK cargado y herramientas listas)
+- Arranque del intérprete vacío, como referencia de lo que no depende del servidor
+
+Uso:
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 10 --target-ms 150
+
+Sale con código 1 si la mediana hasta 'initialize' supera el objetivo.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SERVER = Path(__file__).parent.parent / "src" / "launcher.py"
+
+INITIALIZE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2025-06-18",
+        "capabilities": {},
+        "clientInfo": {"name": "bench-startup", "version": "1.0"},
+    },
+}
+INITIALIZED = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+LIST_TOOLS = {"jsonrpc": "2.0", "id": 2, "method": "tools/list"}
+
+
+def send(proc, message):
+    proc.stdin.write((json.dumps(message) + "\n").encode("utf-8"))
+    proc.stdin.flush()
+
+
+def read_response(proc, request_id):
+    while True:
+        line = proc.stdout.readline()
+        if not line:
+            raise RuntimeError("El servidor cerró stdout sin responder")
+        message = json.loads(line)
+        if message.get("id") == request_id:
+            return message
+
+
+def measure_once(env):
+    """Arranca el servidor y devuelve (ms hasta initialize, ms hasta tools/list)."""
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, str(SERVER)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env,
+    )
+    try:
+        send(proc, INITIALIZE)
+        read_response(proc, 1)
+        initialize_ms = (time.perf_counter() - started) * 1000
+
+        send(proc, INITIALIZED)
+        send(proc, LIST_TOOLS)
+        tools = read_response(proc, 2)
+        tools_ms = (time.perf_counter() - started) * 1000
+        if "result" not in tools:
+            raise RuntimeError(f"tools/list falló: {tools}")
+        return initialize_ms, tools_ms
+    finally:
+        proc.stdin.close()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def measure_interpreter(env):
+    """Tiempo en ms de arrancar y cerrar un intérprete sin hacer nada."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], env=env, check=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque del servidor MCP")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=150)
+    options = parser.parse_args()
+
+    # Estado aislado para no tocar la base de datos del proyecto
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, MCP_WEB_STATE_DB=str(Path(tmp) / "deployer.db"))
+        results = [measure_once(env) for _ in range(options.runs)]
+        baseline = statistics.median(measure_interpreter(env) for _ in range(options.runs))
+
+    initialize = [r[0] for r in results]
+    tools = [r[1] for r in results]
+    median = statistics.median(initialize)
+    print(f"initialize: mediana {median:.0f} ms (min {min(initialize):.0f}, max {max(initialize):.0f})")
+    print(f"tools/list: mediana {statistics.median(tools):.0f} ms")
+    print(f"intérprete: mediana {baseline:.0f} ms (python -c pass)")
+    print(f"objetivo:   < {options.target_ms:.0f} ms hasta initialize")
+
+    if median > options.target_ms:
+        print("❌ Arranque por encima del objetivo")
+        sys.exit(1)
+    print("✅ Arranque dentro del objetivo")
+
+
+if __name__ == "__main__":
+    main()
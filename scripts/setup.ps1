@@ -60,7 +60,7 @@ Write-Host ""
 
 $projectDir = Split-Path -Parent (Split-Path -Parent $MyInvocation.MyCommand.Path)
 $pythonPath = Join-Path $projectDir "venv\Scripts\python.exe"
-$serverPath = Join-Path $projectDir "src\server.py"
+$serverPath = Join-Path $projectDir "src\launcher.py"
 
 $config = @{
     mcpServers = @{
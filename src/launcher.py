@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Punto de entrada ligero del MCP Web Deployer Server.
+
+Responde al handshake 'initialize' por stdio antes de importar
+src/server.py: compilar ese módulo y sus dependencias (asyncio, sqlite3...)
+cuesta más que todo el arranque del intérprete, y el SDK de MCP cerca de un
+segundo. Aquí solo se usan módulos que el intérprete ya trae cargados o que
+cuestan poco (json).
+
+Uso (es lo que debe lanzar Claude Desktop):
+    python src/launcher.py
+
+Con argumentos (--transport http, --port...) o MCP_WEB_TRANSPORT=http
+delega directamente en server.main(), sin handshake anticipado.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+from typing import Any, Optional
+
+# Identidad del servidor MCP y versiones del protocolo aceptadas en el
+# handshake: las mismas que SUPPORTED_PROTOCOL_VERSIONS del SDK fijado en
+# requirements.txt (la última es la preferida). Los tests fallan si divergen.
+SERVER_NAME = "web-deployer"
+SERVER_VERSION = "1.0.0"
+PROTOCOL_VERSIONS = ("2024-11-05", "2025-03-26", "2025-06-18", "2025-11-25")
+
+
+def initialize_result(params: dict) -> dict:
+    """
+    Construye la respuesta a 'initialize' sin cargar el SDK de MCP.
+    
+    Coincide con la que generaría el SDK para este servidor: misma
+    negociación de versión, capacidades (solo herramientas) e identidad.
+    
+    Args:
+        params: Parámetros de la petición 'initialize' del cliente
+    
+    Returns:
+        Resultado JSON-RPC de 'initialize'
+    """
+    requested = params.get("protocolVersion")
+    return {
+        "protocolVersion": requested if requested in PROTOCOL_VERSIONS else PROTOCOL_VERSIONS[-1],
+        "capabilities": {"experimental": {}, "tools": {"listChanged": False}},
+        "serverInfo": {"name": SERVER_NAME, "version": SERVER_VERSION},
+    }
+
+
+def read_handshake(stdin, stdout) -> tuple[bytes, Optional[Any]]:
+    """
+    Lee el primer mensaje de stdin y, si es 'initialize', lo responde.
+    
+    El SDK recibe después ese mismo mensaje (ver server.ReplayedStdin) y
+    su respuesta duplicada se descarta (ver server.HandshakeStdout).
+    
+    Args:
+        stdin: Entrada binaria (sys.stdin.buffer)
+        stdout: Salida binaria (sys.stdout.buffer)
+    
+    Returns:
+        Tupla (primera línea leída, id del 'initialize' respondido o None).
+        La línea es b"" si stdin se cerró sin mensajes.
+    """
+    first = stdin.readline()
+    try:
+        message = json.loads(first) if first else None
+    except ValueError:
+        message = None
+    if not (isinstance(message, dict) and message.get("method") == "initialize" and "id" in message):
+        return first, None
+    
+    response = {
+        "jsonrpc": "2.0",
+        "id": message["id"],
+        "result": initialize_result(message.get("params") or {}),
+    }
+    stdout.write(json.dumps(response, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n")
+    stdout.flush()
+    return first, message["id"]
+
+
+def main():
+    """
+    Responde al handshake y arranca el servidor completo.
+    
+    Si el SDK no está instalado no se responde nada: server.main()
+    informa del error.
+    """
+    import importlib.util
+    handshake = None
+    stdio = len(sys.argv) == 1 and os.environ.get("MCP_WEB_TRANSPORT", "stdio") == "stdio"
+    if stdio and importlib.util.find_spec("mcp") is not None:
+        handshake = read_handshake(sys.stdin.buffer, sys.stdout.buffer)
+    
+    try:
+        from src import server
+    except ImportError:  # python src/launcher.py: src/ es el primer elemento de sys.path
+        import server
+    import asyncio
+    asyncio.run(server.main(handshake))
+
+
+if __name__ == "__main__":
+    main()
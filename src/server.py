@@ -15,31 +15,1580 @@ Este proyecto demuestra:
 - Buenas prácticas de desarrollo Python
 """
 
+from __future__ import annotations
+
 import asyncio
+import contextvars
+import hashlib
 import json
+import random
+import re
+import secrets
+import shlex
+import shutil
+import socket
+import sqlite3
 import sys
 import os
+import threading
+import time
+import weakref
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Optional
 
-try:
-    from mcp.server import Server
-    from mcp.types import Tool, TextContent
-    from mcp.server.stdio import stdio_server
-except ImportError:
-    print("Error: MCP SDK no instalado. Ejecuta: pip install mcp")
-    sys.exit(1)
+# El SDK de MCP (Server, Tool, TextContent, stdio_server) se importa bajo
+# demanda: cargarlo cuesta del orden de un segundo y el handshake
+# 'initialize' se responde antes (ver src/launcher.py y _serve_stdio)
+
+# Identidad del servidor y respuesta rápida al handshake: viven en el
+# módulo ligero del punto de entrada, que lo responde sin compilar este
+try:
+    from src.launcher import (
+        PROTOCOL_VERSIONS, SERVER_NAME, SERVER_VERSION, initialize_result, read_handshake
+    )
+except ImportError:  # python src/server.py: src/ es el primer elemento de sys.path
+    from launcher import (
+        PROTOCOL_VERSIONS, SERVER_NAME, SERVER_VERSION, initialize_result, read_handshake
+    )
+
+# Configuración de rutas
+# Obtiene el directorio raíz del proyecto (dos niveles arriba de este archivo)
+PROJECT_ROOT = Path(__file__).parent.parent
+WWW_DIR = PROJECT_ROOT / "www"
+EXAMPLES_DIR = PROJECT_ROOT / "examples"
+
+# Nombre del contenedor Docker
+CONTAINER_NAME = "mcp-web-server"
+DEFAULT_PORT = 8080
+
+# Imagen Docker del servidor web (configurable por variables de entorno)
+# - MCP_WEB_IMAGE: nombre/tag de la imagen
+# - MCP_WEB_IMAGE_DIGEST: digest fijado (sha256:...) para despliegues reproducibles
+# - MCP_WEB_IMAGE_TARBALL: archivo generado con 'docker save' para hosts sin red
+NGINX_IMAGE = os.environ.get("MCP_WEB_IMAGE", "nginx:alpine")
+NGINX_IMAGE_DIGEST = os.environ.get("MCP_WEB_IMAGE_DIGEST", "")
+NGINX_IMAGE_TARBALL = os.environ.get("MCP_WEB_IMAGE_TARBALL", "")
+
+# Tiempo máximo (segundos) de un comando Docker antes de cancelarlo
+# (MCP_WEB_DOCKER_TIMEOUT). Generoso porque incluye 'docker pull'.
+DOCKER_TIMEOUT = float(os.environ.get("MCP_WEB_DOCKER_TIMEOUT", "300"))
+
+# Máximo de comandos Docker simultáneos (MCP_WEB_DOCKER_CONCURRENCY).
+# Con varios agentes en paralelo evita saturar el daemon de Docker;
+# el resto de comandos espera turno.
+DOCKER_CONCURRENCY = int(os.environ.get("MCP_WEB_DOCKER_CONCURRENCY", "4"))
+
+# Rango de puertos para la asignación automática (MCP_WEB_PORT_RANGE, ej: "8080-8180")
+PORT_RANGE = os.environ.get("MCP_WEB_PORT_RANGE", f"{DEFAULT_PORT}-{DEFAULT_PORT + 100}")
+
+# Comprobación de disponibilidad (readiness) tras 'docker run'
+# - MCP_WEB_READY_TIMEOUT: segundos máximos de espera antes de responder
+# - MCP_WEB_HEALTH_PATH: ruta HTTP usada por la comprobación y el HEALTHCHECK
+READY_TIMEOUT = float(os.environ.get("MCP_WEB_READY_TIMEOUT", "15"))
+HEALTH_PATH = os.environ.get("MCP_WEB_HEALTH_PATH", "/")
+# Sin '&' ni otros metacaracteres: la ruta acaba en el HEALTHCHECK (/bin/sh -c)
+HEALTH_PATH_PATTERN = "^/[A-Za-z0-9._~/?=%-]*$"
+
+# Caché HTTP opcional delante del sitio (deploy_server con cache=true)
+# - MCP_WEB_CACHE_SIZE_MB: tamaño de la caché en memoria
+# - MCP_WEB_CACHE_TTL: segundos que una página se sirve desde caché
+CACHE_SIZE_MB = int(os.environ.get("MCP_WEB_CACHE_SIZE_MB", "64"))
+CACHE_TTL = int(os.environ.get("MCP_WEB_CACHE_TTL", "60"))
+CACHE_PATH = "/var/cache/nginx/edge"
+ORIGIN_PORT = 8081
+
+# Archivos generados en tiempo de ejecución (configuración de nginx)
+RUNTIME_DIR = PROJECT_ROOT / "runtime"
+
+# Certificados TLS locales (CA propia + un certificado por sitio)
+CERTS_DIR = PROJECT_ROOT / "certs"
+CERTS_MOUNT = "/etc/nginx/certs"
+# Serializa la generación de la CA y los certificados entre despliegues
+# concurrentes (ensure_site_certificate corre en hilos del executor)
+_CERTS_LOCK = threading.Lock()
+
+# Access logs JSON de nginx (un subdirectorio por contenedor) y su analítica
+# - MCP_WEB_LOG_MAX_MB: tamaño a partir del cual nginx rota el log (USR1) tras leerlo
+# - MCP_WEB_TRAFFIC_POLL: segundos entre lecturas del log en segundo plano
+LOGS_DIR = PROJECT_ROOT / "logs"
+ACCESS_LOG_DIR = "/var/log/nginx/mcp"
+ACCESS_LOG_NAME = "access.json"
+ACCESS_LOG_MAX_BYTES = int(os.environ.get("MCP_WEB_LOG_MAX_MB", "50")) * 1024 * 1024
+TRAFFIC_POLL = float(os.environ.get("MCP_WEB_TRAFFIC_POLL", "2"))
+
+# Base de datos SQLite con el estado de los despliegues
+# (sitios, contenedores, puertos, versiones de contenido e historial de tiempos)
+STATE_DB = Path(os.environ.get("MCP_WEB_STATE_DB", PROJECT_ROOT / "state" / "deployer.db"))
+
+# Sitio por defecto: el directorio www/ servido por CONTAINER_NAME
+DEFAULT_SITE = "default"
+
+# Transporte MCP
+# - MCP_WEB_TRANSPORT: "stdio" (un proceso por cliente, default) o "http"
+#   (un proceso compartido por muchos clientes: streamable HTTP en /mcp
+#   y SSE en /sse + /messages/)
+# - MCP_WEB_HTTP_HOST / MCP_WEB_HTTP_PORT: dirección de escucha del modo http
+TRANSPORT = os.environ.get("MCP_WEB_TRANSPORT", "stdio")
+HTTP_HOST = os.environ.get("MCP_WEB_HTTP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.environ.get("MCP_WEB_HTTP_PORT", "8765"))
+
+# Sitios aislados por sesión en modo http: cada sesión trabaja en
+# sites/<sitio>/ y despliega su propio contenedor CONTAINER_NAME-<sitio>.
+# El cliente puede fijar el sitio con la cabecera X-MCP-Site para
+# recuperarlo al reconectar; si no, se asigna uno aleatorio que nadie
+# puede volver a pedir, así que se elimina (contenedor, puertos y
+# archivos) al cerrar la sesión.
+SITES_DIR = PROJECT_ROOT / "sites"
+SITE_HEADER = "x-mcp-site"
+SITE_NAME_PATTERN = "^[a-z0-9][a-z0-9-]{0,31}$"
+# Estado de la sesión http en curso (ver WebDeployerServer._run_session)
+_SESSION_STATE: contextvars.ContextVar[dict] = contextvars.ContextVar("mcp_web_session")
+
+# Formato de las respuestas de las herramientas
+# - "text": mensajes legibles con emojis (default)
+# - "json": JSON compacto con esquema estable {"ok", "tool", ...}
+# - MCP_WEB_RESPONSE_FORMAT: formato por defecto si la llamada no indica 'format'
+# Un cliente que anuncie la capacidad experimental COMPACT_CAPABILITY
+# recibe JSON por defecto. Los listados grandes se parten en trozos.
+RESPONSE_FORMAT = os.environ.get("MCP_WEB_RESPONSE_FORMAT", "text")
+COMPACT_CAPABILITY = "compactResponses"
+LIST_CHUNK_SIZE = 200
+FORMAT_PROPERTY = {
+    "type": "string",
+    "enum": ["text", "json"],
+    "description": "Formato de la respuesta: texto legible o JSON compacto"
+}
+
+
+class ReplayedStdin:
+    """
+    Entrada estándar para el SDK que empieza por líneas ya leídas.
+    
+    Permite leer el primer mensaje antes de cargar el SDK y entregárselo
+    después, seguido del resto de la entrada real.
+    """
+    
+    def __init__(self, lines: list[str], stdin):
+        self._lines = lines
+        self._stdin = stdin
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        for line in self._lines:
+            yield line
+        async for line in self._stdin:
+            yield line
+
+
+class HandshakeStdout:
+    """
+    Salida estándar para el SDK que descarta su respuesta a 'initialize'.
+    
+    El handshake ya se respondió antes de cargar el SDK; su respuesta
+    duplicada (mismo id) no debe llegar al cliente.
+    """
+    
+    def __init__(self, stdout, handshake_id: Any = None):
+        self._stdout = stdout
+        self._handshake_id = handshake_id
+    
+    async def write(self, data: str):
+        if self._handshake_id is not None:
+            message = json.loads(data)
+            if message.get("id") == self._handshake_id and "result" in message:
+                self._handshake_id = None
+                return
+        await self._stdout.write(data)
+    
+    async def flush(self):
+        await self._stdout.flush()
+
+
+def compact_json(data: Any) -> str:
+    """
+    Serializa una respuesta en JSON compacto (sin espacios, UTF-8 literal).
+    
+    Args:
+        data: Objeto serializable
+    
+    Returns:
+        Cadena JSON
+    """
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def image_reference() -> str:
+    """
+    Construye la referencia completa de la imagen a desplegar.
+    
+    Si hay un digest configurado se fija la imagen con 'imagen@sha256:...',
+    de modo que todos los despliegues usan exactamente el mismo contenido.
+    
+    Returns:
+        Referencia de imagen usable con 'docker run'
+    """
+    if NGINX_IMAGE_DIGEST:
+        return f"{NGINX_IMAGE}@{NGINX_IMAGE_DIGEST}"
+    return NGINX_IMAGE
+
+
+def health_check_args(image: str, health_path: str) -> list[str]:
+    """
+    Argumentos de 'docker run' para el HEALTHCHECK del contenedor.
+    
+    Docker ejecuta el comando con /bin/sh -c, así que la URL va entre
+    comillas. La sonda usa el wget de busybox, que solo traen las imágenes
+    Alpine; las imágenes Debian de nginx no tienen wget ni curl, de modo
+    que con ellas no se define HEALTHCHECK (la disponibilidad se sigue
+    comprobando desde el host con wait_until_ready).
+    
+    Args:
+        image: Referencia de la imagen a desplegar
+        health_path: Ruta HTTP ya validada con HEALTH_PATH_PATTERN
+    
+    Returns:
+        Lista de argumentos (vacía si la imagen no tiene sonda)
+    """
+    name = image.split("@")[0].rsplit("/", 1)[-1]
+    if "alpine" not in name:
+        return []
+    url = shlex.quote(f"http://127.0.0.1{health_path}")
+    return [
+        "--health-cmd", f"wget -q -O /dev/null {url} || exit 1",
+        "--health-interval", "10s",
+        "--health-timeout", "3s",
+        "--health-retries", "3",
+        "--health-start-period", "2s",
+    ]
+
+
+def parse_host_port(ports: str, container_port: Optional[int] = None) -> Optional[int]:
+    """
+    Extrae el puerto del host de la columna 'Ports' de 'docker ps'.
+    
+    Ejemplo: '0.0.0.0:8080->80/tcp, :::8080->80/tcp' -> 8080
+    
+    Args:
+        ports: Texto de la columna Ports
+        container_port: Puerto del contenedor buscado (default: el primero)
+    
+    Returns:
+        Puerto del host, o None si el contenedor no publica puertos
+    """
+    for mapping in ports.split(","):
+        host, sep, target = mapping.strip().partition("->")
+        if container_port is not None and not target.startswith(f"{container_port}/"):
+            continue
+        if sep and ":" in host:
+            try:
+                return int(host.rsplit(":", 1)[1])
+            except ValueError:
+                continue
+    return None
+
+
+def docker_volume_path(path: Path) -> str:
+    """
+    Convierte una ruta del host al formato que Docker acepta en '-v'.
+    
+    - Windows: 'C:\\MCP\\www' -> 'C:/MCP/www' (Docker Desktop entiende la
+      letra de unidad con barras normales, cualquiera que sea la unidad)
+    - Linux/macOS: la ruta absoluta tal cual
+    
+    Args:
+        path: Ruta del host
+    
+    Returns:
+        Ruta absoluta lista para un argumento de volumen
+    """
+    absolute = Path(path).absolute()
+    if os.name == "nt":
+        return str(absolute).replace("\\", "/")
+    return str(absolute)
+
+
+@dataclass
+class CommandResult:
+    """
+    Resultado estructurado de un comando externo.
+    
+    Attributes:
+        argv: Comando ejecutado
+        returncode: Código de salida (-1 si se canceló por timeout,
+            127 si el ejecutable no existe)
+        stdout: Salida estándar decodificada y sin espacios finales
+        stderr: Salida de error decodificada y sin espacios finales
+        duration_ms: Duración en milisegundos
+        timed_out: True si se canceló por superar el timeout
+    """
+    argv: list[str]
+    returncode: int
+    stdout: str
+    stderr: str
+    duration_ms: float
+    timed_out: bool = False
+    
+    @property
+    def ok(self) -> bool:
+        """True si el comando terminó con código 0."""
+        return self.returncode == 0 and not self.timed_out
+
+
+class CommandExecutor:
+    """
+    Ejecutor de comandos externos basado en listas argv.
+    
+    Usa asyncio.create_subprocess_exec (sin shell intermedio), por lo que
+    se comporta igual en Windows, Linux y macOS: no hay redirecciones
+    específicas de cmd.exe, ni comillas que escapar, ni procesos en
+    segundo plano que compitan entre sí.
+    
+    Como mucho 'concurrency' comandos se ejecutan a la vez; el resto
+    espera turno (el timeout cuenta desde que el comando arranca).
+    
+    Attributes:
+        timeout (float): Timeout por defecto en segundos
+        concurrency (int): Máximo de comandos simultáneos
+    """
+    
+    def __init__(self, timeout: float = DOCKER_TIMEOUT, concurrency: int = DOCKER_CONCURRENCY):
+        """
+        Args:
+            timeout: Timeout por defecto en segundos
+            concurrency: Máximo de comandos simultáneos
+        """
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self._slots: Optional[asyncio.Semaphore] = None
+    
+    async def run(self, argv: list[str], timeout: Optional[float] = None) -> CommandResult:
+        """
+        Ejecuta un comando y captura su salida.
+        
+        Si supera el timeout el proceso se termina y el resultado queda
+        marcado con timed_out. Nunca lanza excepciones por el comando en sí.
+        
+        Args:
+            argv: Comando y argumentos
+            timeout: Timeout en segundos (default: el del ejecutor)
+        
+        Returns:
+            CommandResult con código, salidas y duración
+        """
+        # Se crea aquí y no en __init__ para ligarlo al event loop en uso
+        if self._slots is None:
+            self._slots = asyncio.BoundedSemaphore(self.concurrency)
+        async with self._slots:
+            return await self._run(argv, timeout)
+    
+    async def _run(self, argv: list[str], timeout: Optional[float]) -> CommandResult:
+        started = time.perf_counter()
+        
+        def result(code: int, out: bytes = b"", err: bytes = b"", timed_out: bool = False):
+            return CommandResult(
+                argv=list(argv),
+                returncode=code,
+                stdout=out.decode(errors="replace").strip(),
+                stderr=err.decode(errors="replace").strip(),
+                duration_ms=(time.perf_counter() - started) * 1000,
+                timed_out=timed_out,
+            )
+        
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *argv,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            return result(127, err=f"Comando no encontrado: {argv[0]}".encode())
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                proc.communicate(), timeout if timeout is not None else self.timeout
+            )
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return result(-1, err=b"Timeout", timed_out=True)
+        
+        return result(proc.returncode, stdout, stderr)
+    
+    async def run_all(self, *argvs: list[str], timeout: Optional[float] = None) -> list[CommandResult]:
+        """
+        Ejecuta varios comandos independientes en paralelo.
+        
+        Returns:
+            Resultados en el mismo orden que los comandos
+        """
+        return list(await asyncio.gather(*(self.run(argv, timeout) for argv in argvs)))
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas idénticas simultáneas en una sola ejecución.
+    
+    Mientras una operación con una clave está en curso, las demás llamadas
+    con la misma clave esperan su resultado en lugar de repetirla. Al
+    terminar se olvida: no es una caché, la siguiente llamada vuelve a
+    ejecutarla.
+    """
+    
+    def __init__(self):
+        self._inflight: dict[Any, asyncio.Future] = {}
+    
+    async def do(self, key: Any, factory):
+        """
+        Ejecuta factory() o se une a la ejecución en curso con la misma clave.
+        
+        Args:
+            key: Clave que identifica la operación
+            factory: Función sin argumentos que devuelve una corrutina
+        
+        Returns:
+            Resultado de la operación (compartido por todas las llamadas)
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(
+                lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None
+            )
+        # shield: cancelar una de las llamadas no cancela la de las demás
+        return await asyncio.shield(future)
+
+
+class PortUnavailableError(Exception):
+    """El puerto solicitado está ocupado o no quedan puertos libres en el rango."""
+
+
+def port_is_free(port: int) -> bool:
+    """
+    Comprueba si un puerto del host está libre intentando enlazarlo.
+    
+    Docker publica los puertos en todas las interfaces, así que se prueba
+    con 0.0.0.0. Es mucho más barato que descubrir el conflicto después
+    de arrancar el contenedor.
+    
+    Como Docker, se enlaza con SO_REUSEADDR: las conexiones en TIME_WAIT
+    que deja un contenedor recién detenido (o las sondas de disponibilidad)
+    no cuentan como puerto ocupado; un proceso escuchando sí. En Windows
+    SO_REUSEADDR permitiría robar un puerto en uso y TIME_WAIT no bloquea
+    el bind, así que allí no se activa.
+    
+    Args:
+        port: Puerto TCP a comprobar
+    
+    Returns:
+        True si el puerto se pudo enlazar
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        if os.name != "nt":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("0.0.0.0", port))
+        except OSError:
+            return False
+    return True
+
+
+class PortAllocator:
+    """
+    Asignador de puertos con tabla de reservas.
+    
+    Mantiene una cola de puertos libres del rango configurado (asignación
+    en O(1)) y una tabla puerto -> propietario. Cada propietario (nombre de
+    contenedor) tiene como máximo un puerto reservado.
+    
+    Las operaciones son síncronas: al no haber 'await' entre la
+    comprobación y la reserva, dos despliegues en paralelo nunca pueden
+    recibir el mismo puerto.
+    
+    Attributes:
+        start (int): Primer puerto del rango
+        end (int): Último puerto del rango (incluido)
+    """
+    
+    def __init__(self, start: int, end: int):
+        """
+        Args:
+            start: Primer puerto del rango
+            end: Último puerto del rango (incluido)
+        """
+        if not 1024 <= start <= end <= 65535:
+            raise ValueError(f"Rango de puertos inválido: {start}-{end}")
+        self.start = start
+        self.end = end
+        self._free = deque(range(start, end + 1))
+        self._free_set = set(self._free)
+        self._owners: dict[int, str] = {}
+        self._ports: dict[str, int] = {}
+    
+    @classmethod
+    def from_range(cls, value: str) -> "PortAllocator":
+        """Crea el asignador a partir de un texto 'inicio-fin'."""
+        start, _, end = value.partition("-")
+        return cls(int(start), int(end or start))
+    
+    def port_of(self, owner: str) -> Optional[int]:
+        """Puerto reservado por un propietario, si tiene alguno."""
+        return self._ports.get(owner)
+    
+    def reservations(self) -> dict[int, str]:
+        """Copia de la tabla de reservas puerto -> propietario."""
+        return dict(self._owners)
+    
+    def _take(self, owner: str, port: int):
+        previous = self._ports.get(owner)
+        if previous is not None and previous != port:
+            self.release(owner)
+        self._free_set.discard(port)
+        self._owners[port] = owner
+        self._ports[owner] = port
+    
+    def reserve(self, owner: str, port: Optional[int] = None) -> int:
+        """
+        Reserva un puerto para un propietario.
+        
+        - Con puerto explícito: lo reserva si nadie más lo tiene y el host
+          lo puede enlazar (o si ya es del mismo propietario).
+        - Sin puerto: reutiliza el del propietario o toma el siguiente
+          libre del rango, saltando los que estén ocupados en el host.
+        
+        Args:
+            owner: Identificador del propietario (nombre del contenedor)
+            port: Puerto solicitado, opcional
+        
+        Returns:
+            Puerto reservado
+        
+        Raises:
+            PortUnavailableError: Si el puerto no está disponible
+        """
+        if port is None:
+            port = self._ports.get(owner)
+            if port is None:
+                return self._reserve_next(owner)
+        
+        holder = self._owners.get(port)
+        if holder == owner:
+            return port
+        if holder is not None:
+            raise PortUnavailableError(f"El puerto {port} está reservado por '{holder}'")
+        if not port_is_free(port):
+            raise PortUnavailableError(f"El puerto {port} está en uso en el host")
+        self._take(owner, port)
+        return port
+    
+    def _reserve_next(self, owner: str) -> int:
+        # Cada puerto se prueba como mucho una vez; los ocupados en el host
+        # pasan al final de la cola para reintentarlos más adelante.
+        for _ in range(len(self._free)):
+            candidate = self._free.popleft()
+            if candidate not in self._free_set:
+                continue  # reservado explícitamente antes: entrada obsoleta
+            if port_is_free(candidate):
+                self._take(owner, candidate)
+                return candidate
+            self._free.append(candidate)
+        raise PortUnavailableError(
+            f"No hay puertos libres en el rango {self.start}-{self.end}"
+        )
+    
+    def adopt(self, owner: str, port: int):
+        """Registra una reserva existente (p. ej. un contenedor ya activo) sin comprobar el host."""
+        self._take(owner, port)
+    
+    def release(self, owner: str) -> Optional[int]:
+        """
+        Libera el puerto de un propietario.
+        
+        Returns:
+            Puerto liberado, o None si no tenía ninguno
+        """
+        port = self._ports.pop(owner, None)
+        if port is None:
+            return None
+        self._owners.pop(port, None)
+        if self.start <= port <= self.end and port not in self._free_set:
+            self._free_set.add(port)
+            self._free.append(port)
+        return port
+
+
+async def http_status(port: int, path: str = "/", headers: Optional[dict] = None,
+                      timeout: float = 5.0, host: str = "127.0.0.1") -> Optional[int]:
+    """
+    Hace un 'GET path' mínimo y retorna el código de estado HTTP.
+    
+    Solo lee la línea de estado: basta para saber si nginx sirve y para
+    forzar el refresco de la caché, sin dependencias externas.
+    
+    Args:
+        port: Puerto del host mapeado al contenedor
+        path: Ruta HTTP a solicitar
+        headers: Cabeceras adicionales
+        timeout: Tiempo máximo en segundos
+        host: Host al que conectar
+    
+    Returns:
+        Código HTTP, o None si no hubo respuesta válida
+    """
+    extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    request = f"GET {path} HTTP/1.1\r\nHost: localhost\r\n{extra}Connection: close\r\n\r\n"
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        try:
+            writer.write(request.encode())
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), timeout)
+        finally:
+            writer.close()
+        parts = status_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0].startswith("HTTP/"):
+            return int(parts[1])
+    except (OSError, asyncio.TimeoutError, ValueError):
+        pass
+    return None
+
+
+async def wait_until_ready(port: int, path: str = "/", timeout: float = READY_TIMEOUT,
+                           host: str = "127.0.0.1") -> Optional[float]:
+    """
+    Espera a que un servidor HTTP responda en el puerto indicado.
+    
+    Cada intento hace una conexión TCP seguida de 'GET path'. Cualquier
+    respuesta HTTP que no sea 5xx cuenta como lista (un 404 significa que
+    nginx ya está sirviendo). Entre intentos se espera con backoff
+    exponencial (50 ms, 100 ms, ... hasta 1 s).
+    
+    Args:
+        port: Puerto del host mapeado al contenedor
+        path: Ruta HTTP a solicitar
+        timeout: Tiempo máximo total en segundos
+        host: Host al que conectar
+    
+    Returns:
+        Segundos hasta estar listo, o None si se agotó el tiempo
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    deadline = started + timeout
+    delay = 0.05
+    
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return None
+        status = await http_status(port, path, timeout=remaining, host=host)
+        if status is not None and status < 500:
+            return loop.time() - started
+        
+        await asyncio.sleep(min(delay, max(deadline - loop.time(), 0)))
+        delay = min(delay * 2, 1.0)
+
+
+def render_nginx_conf(cache_size_mb: Optional[int] = None, cache_ttl: int = 60,
+                      tls: bool = False) -> str:
+    """
+    Genera la configuración de nginx del sitio desplegado.
+    
+    Siempre escribe un access log en JSON (una línea por petición) en el
+    volumen de logs, que luego agrega 'site_traffic'.
+    
+    Con caché (cache_size_mb indicado), dentro del mismo contenedor:
+    - Origen (127.0.0.1:8081): sirve www/ con ETag y Last-Modified
+    - Frontal: proxy_cache en memoria (tmpfs) hacia el origen
+    
+    La caché revalida con peticiones condicionales al expirar y responde
+    304 a los clientes que envían If-None-Match / If-Modified-Since.
+    Una petición con la cabecera 'X-MCP-Purge' salta la caché y guarda
+    la respuesta nueva: es el mecanismo de purga por ruta (nginx
+    open source no incluye proxy_cache_purge).
+    
+    Con TLS, el mismo sitio se sirve además en :443 con HTTP/2 y caché de
+    sesiones TLS (session cache compartida + tickets), de modo que las
+    visitas repetidas reanudan la sesión sin handshake completo. Sin OCSP
+    stapling: los certificados son de una CA local. HTTP/2 se activa con la
+    directiva 'http2 on' (nginx >= 1.25.1; 'listen ... http2' está
+    obsoleto y avisa en cada arranque). La clave de caché no
+    incluye el esquema, así que HTTP y HTTPS comparten entradas y una
+    purga por ruta vale para ambos.
+    
+    Args:
+        cache_size_mb: Tamaño máximo de la caché en MB (None = sin caché)
+        cache_ttl: Segundos que una respuesta 200 se considera fresca
+        tls: Servir también HTTPS/HTTP2 con los certificados de /etc/nginx/certs
+    
+    Returns:
+        Contenido para /etc/nginx/conf.d/default.conf
+    """
+    log_format = (
+        "log_format mcp_json escape=json '{"
+        '"ts":$msec,"path":"$uri","status":$status,"bytes":$body_bytes_sent,'
+        '"request_time":$request_time,"upstream_time":"$upstream_response_time",'
+        '"cache":"$upstream_cache_status"'
+        "}';"
+    )
+    
+    listen = "    listen 80;\n"
+    if tls:
+        listen += f"""    listen 443 ssl;
+    http2 on;
+
+    ssl_certificate {CERTS_MOUNT}/site.crt;
+    ssl_certificate_key {CERTS_MOUNT}/site.key;
+    ssl_protocols TLSv1.2 TLSv1.3;
+    ssl_session_cache shared:MCPSSL:10m;
+    ssl_session_timeout 1d;
+    ssl_session_tickets on;
+    ssl_stapling off;
+"""
+    access_log = f"    access_log {ACCESS_LOG_DIR}/{ACCESS_LOG_NAME} mcp_json;\n"
+    
+    if cache_size_mb is None:
+        return f"""{log_format}
+
+server {{
+{listen}{access_log}
+    root /usr/share/nginx/html;
+    index index.html;
+    etag on;
+}}
+"""
+    
+    return f"""{log_format}
+
+proxy_cache_path {CACHE_PATH} levels=1:2 keys_zone=edge:10m
+                 max_size={cache_size_mb}m inactive={max(cache_ttl, 60)}s use_temp_path=off;
+
+server {{
+    listen 127.0.0.1:{ORIGIN_PORT};
+    root /usr/share/nginx/html;
+    index index.html;
+    etag on;
+    access_log off;
+}}
+
+server {{
+{listen}{access_log}
+    location / {{
+        proxy_pass http://127.0.0.1:{ORIGIN_PORT};
+        proxy_set_header Host $host;
+        proxy_http_version 1.1;
+
+        proxy_cache edge;
+        proxy_cache_key $proxy_host$request_uri;
+        proxy_cache_valid 200 301 302 {cache_ttl}s;
+        proxy_cache_valid 404 10s;
+        proxy_cache_revalidate on;
+        proxy_cache_lock on;
+        proxy_cache_use_stale error timeout updating;
+        proxy_cache_background_update on;
+        proxy_cache_bypass $http_x_mcp_purge;
+
+        add_header X-Cache-Status $upstream_cache_status always;
+    }}
+}}
+"""
+
+
+def ensure_site_certificate(site: str) -> tuple[Path, Path]:
+    """
+    Asegura una CA local y un certificado para el sitio (bloqueante).
+    
+    - CA: certs/ca/ca.crt + ca.key (10 años). Importa ca.crt en el
+      navegador o en el sistema para confiar en los sitios locales.
+    - Sitio: certs/<site>/site.crt + site.key firmados por la CA, con
+      SAN localhost / 127.0.0.1 / ::1. Se regeneran si faltan o vencen
+      en menos de 30 días.
+    
+    Se usan claves EC P-256: handshakes más baratos que RSA.
+    Requiere el paquete opcional 'cryptography'.
+    
+    Args:
+        site: Nombre del sitio (subdirectorio de certs/)
+    
+    Returns:
+        Tupla (directorio con site.crt/site.key, ruta de ca.crt)
+    
+    Raises:
+        RuntimeError: Si 'cryptography' no está instalado
+    """
+    try:
+        import ipaddress
+        from datetime import timedelta, timezone
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+    except ImportError:
+        raise RuntimeError("TLS requiere el paquete 'cryptography'. Ejecuta: pip install cryptography")
+    
+    now = datetime.now(timezone.utc)
+    
+    def still_valid(cert_path: Path) -> bool:
+        if not cert_path.exists():
+            return False
+        cert = x509.load_pem_x509_certificate(cert_path.read_bytes())
+        expires = getattr(cert, "not_valid_after_utc", None)
+        if expires is None:  # cryptography < 42
+            expires = cert.not_valid_after.replace(tzinfo=timezone.utc)
+        return expires - now > timedelta(days=30)
+    
+    def write_pair(directory: Path, stem: str, cert, key):
+        directory.mkdir(parents=True, exist_ok=True)
+        key_path = directory / f"{stem}.key"
+        # La clave nace con 0600: nunca es legible con los permisos del umask
+        fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            ))
+        key_path.chmod(0o600)  # por si ya existía con otros permisos
+        (directory / f"{stem}.crt").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    
+    with _CERTS_LOCK:
+        ca_dir = CERTS_DIR / "ca"
+        if not still_valid(ca_dir / "ca.crt"):
+            ca_key = ec.generate_private_key(ec.SECP256R1())
+            ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "MCP Web Deployer Local CA")])
+            ca_cert = (
+                x509.CertificateBuilder()
+                .subject_name(ca_name)
+                .issuer_name(ca_name)
+                .public_key(ca_key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - timedelta(minutes=5))
+                .not_valid_after(now + timedelta(days=3650))
+                .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+                .add_extension(x509.KeyUsage(
+                    digital_signature=True, key_cert_sign=True, crl_sign=True,
+                    content_commitment=False, key_encipherment=False, data_encipherment=False,
+                    key_agreement=False, encipher_only=False, decipher_only=False,
+                ), critical=True)
+                .sign(ca_key, hashes.SHA256())
+            )
+            write_pair(ca_dir, "ca", ca_cert, ca_key)
+            # Los certificados firmados por una CA anterior dejan de valer
+            for old in CERTS_DIR.glob("*/site.crt"):
+                old.unlink()
+        
+        site_dir = CERTS_DIR / site
+        if not still_valid(site_dir / "site.crt"):
+            ca_key = serialization.load_pem_private_key((ca_dir / "ca.key").read_bytes(), None)
+            ca_cert = x509.load_pem_x509_certificate((ca_dir / "ca.crt").read_bytes())
+            key = ec.generate_private_key(ec.SECP256R1())
+            cert = (
+                x509.CertificateBuilder()
+                .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")]))
+                .issuer_name(ca_cert.subject)
+                .public_key(key.public_key())
+                .serial_number(x509.random_serial_number())
+                .not_valid_before(now - timedelta(minutes=5))
+                .not_valid_after(now + timedelta(days=825))
+                .add_extension(x509.SubjectAlternativeName([
+                    x509.DNSName("localhost"),
+                    x509.IPAddress(ipaddress.ip_address("127.0.0.1")),
+                    x509.IPAddress(ipaddress.ip_address("::1")),
+                ]), critical=False)
+                .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+                .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+                .sign(ca_key, hashes.SHA256())
+            )
+            write_pair(site_dir, "site", cert, key)
+        
+        return site_dir, ca_dir / "ca.crt"
+
+
+class CountMinSketch:
+    """
+    Count-min sketch: frecuencias aproximadas en memoria fija.
+    
+    Nunca subestima; sobreestima como mucho ~(2/width) del total con
+    probabilidad 1 - (1/2)^depth.
+    
+    Attributes:
+        width (int): Contadores por fila
+        depth (int): Número de filas (funciones hash)
+    """
+    
+    def __init__(self, width: int = 256, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self._rows = [array("Q", bytes(8 * width)) for _ in range(depth)]
+    
+    def _indexes(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=4 * self.depth).digest()
+        for row in range(self.depth):
+            yield row, int.from_bytes(digest[4 * row:4 * row + 4], "little") % self.width
+    
+    def add(self, key: str, count: int = 1):
+        """Suma 'count' a la frecuencia de 'key'."""
+        for row, index in self._indexes(key):
+            self._rows[row][index] += count
+    
+    def estimate(self, key: str) -> int:
+        """Frecuencia estimada de 'key' (cota superior)."""
+        return min(self._rows[row][index] for row, index in self._indexes(key))
+    
+    def merge(self, other: "CountMinSketch"):
+        """Acumula otro sketch de las mismas dimensiones."""
+        for mine, theirs in zip(self._rows, other._rows):
+            for index, value in enumerate(theirs):
+                if value:
+                    mine[index] += value
+
+
+class Reservoir:
+    """
+    Muestreo por reservorio (algoritmo R): muestra uniforme de tamaño fijo.
+    
+    Attributes:
+        size (int): Tamaño máximo de la muestra
+        seen (int): Valores observados en total
+        samples (list[float]): Muestra actual
+    """
+    
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.seen = 0
+        self.samples: list[float] = []
+    
+    def add(self, value: float):
+        """Observa un valor."""
+        self.seen += 1
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            index = random.randrange(self.seen)
+            if index < self.size:
+                self.samples[index] = value
+
+
+def weighted_percentiles(reservoirs: list[Reservoir], quantiles: tuple) -> dict:
+    """
+    Percentiles combinando varios reservorios.
+    
+    Cada muestra pesa seen/len(samples) de su reservorio, de modo que los
+    minutos con más tráfico cuentan proporcionalmente más.
+    
+    Returns:
+        Diccionario cuantil -> valor (vacío si no hay muestras)
+    """
+    weighted = sorted(
+        (value, r.seen / len(r.samples))
+        for r in reservoirs if r.samples
+        for value in r.samples
+    )
+    if not weighted:
+        return {}
+    total = sum(weight for _, weight in weighted)
+    result, cumulative, i = {}, 0.0, 0
+    for q in sorted(quantiles):
+        while i < len(weighted) - 1 and cumulative + weighted[i][1] < q * total:
+            cumulative += weighted[i][1]
+            i += 1
+        result[q] = weighted[i][0]
+    return result
+
+
+class TrafficWindow:
+    """
+    Agregados de un minuto de tráfico (tamaño fijo).
+    
+    Attributes:
+        minute (int): Minuto (epoch // 60) al que corresponde
+    """
+    
+    TOP_CANDIDATES = 32
+    
+    def __init__(self, minute: int):
+        self.minute = minute
+        self.requests = 0
+        self.bytes = 0
+        self.statuses: dict[int, int] = {}
+        self.paths = CountMinSketch()
+        self.candidates: dict[str, int] = {}
+        self.latency = Reservoir()
+        self.upstream_latency = Reservoir()
+    
+    def add(self, record: dict):
+        path = str(record.get("path", "?"))
+        self.requests += 1
+        self.bytes += int(record.get("bytes", 0) or 0)
+        status = int(record.get("status", 0) or 0)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        
+        # Top de rutas: sketch + conjunto acotado de candidatos (heavy hitters)
+        self.paths.add(path)
+        estimate = self.paths.estimate(path)
+        if path in self.candidates or len(self.candidates) < self.TOP_CANDIDATES:
+            self.candidates[path] = estimate
+        else:
+            weakest = min(self.candidates, key=self.candidates.get)
+            if estimate > self.candidates[weakest]:
+                del self.candidates[weakest]
+                self.candidates[path] = estimate
+        
+        self.latency.add(float(record.get("request_time", 0) or 0))
+        upstream = upstream_seconds(record.get("upstream_time"))
+        if upstream is not None:
+            self.upstream_latency.add(upstream)
+
+
+def upstream_seconds(value) -> Optional[float]:
+    """
+    Interpreta $upstream_response_time de nginx.
+    
+    Puede ser '-' (sin upstream, p. ej. HIT de caché) o varios valores
+    separados por comas si hubo reintentos; se suman.
+    """
+    if value in (None, "", "-"):
+        return None
+    try:
+        return sum(float(part) for part in str(value).replace(":", ",").split(",") if part.strip() != "-")
+    except ValueError:
+        return None
+
+
+class TrafficAnalyzer:
+    """
+    Analítica de tráfico en ventanas deslizantes de memoria fija.
+    
+    Mantiene un anillo de TrafficWindow de un minuto; los minutos que
+    salen del horizonte se reutilizan, así que la memoria no crece con
+    el tráfico.
+    
+    Attributes:
+        horizon (int): Minutos conservados
+    """
+    
+    def __init__(self, horizon: int = 60):
+        self.horizon = horizon
+        self._windows: list[Optional[TrafficWindow]] = [None] * horizon
+    
+    def add(self, record: dict):
+        """Agrega una línea del access log ya parseada."""
+        minute = int(float(record.get("ts", time.time())) // 60)
+        if minute <= int(time.time() // 60) - self.horizon:
+            return  # fuera del horizonte
+        slot = minute % self.horizon
+        window = self._windows[slot]
+        if window is None or window.minute != minute:
+            if window is not None and window.minute > minute:
+                return  # minuto más antiguo que el que ocupa el hueco
+            window = self._windows[slot] = TrafficWindow(minute)
+        window.add(record)
+    
+    def ingest(self, lines: list[str]) -> int:
+        """
+        Agrega líneas JSON del access log, ignorando las inválidas.
+        
+        Returns:
+            Número de líneas agregadas
+        """
+        count = 0
+        for line in lines:
+            try:
+                self.add(json.loads(line))
+                count += 1
+            except (ValueError, TypeError):
+                continue
+        return count
+    
+    def summary(self, minutes: int = 15, top: int = 10, now: Optional[float] = None) -> dict:
+        """
+        Resume el tráfico de los últimos 'minutes' minutos.
+        
+        Returns:
+            Diccionario con requests, bytes, status, top_paths y
+            percentiles de latencia (segundos)
+        """
+        current = int((now if now is not None else time.time()) // 60)
+        windows = [
+            w for w in self._windows
+            if w is not None and current - min(minutes, self.horizon) < w.minute <= current
+        ]
+        
+        statuses: dict[int, int] = {}
+        sketch = CountMinSketch()
+        candidates: set[str] = set()
+        for w in windows:
+            for status, count in w.statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+            sketch.merge(w.paths)
+            candidates.update(w.candidates)
+        
+        top_paths = sorted(
+            ((path, sketch.estimate(path)) for path in candidates),
+            key=lambda item: item[1], reverse=True
+        )[:top]
+        quantiles = (0.5, 0.9, 0.99)
+        return {
+            "minutes": minutes,
+            "requests": sum(w.requests for w in windows),
+            "bytes": sum(w.bytes for w in windows),
+            "status": dict(sorted(statuses.items())),
+            "top_paths": top_paths,
+            "latency": weighted_percentiles([w.latency for w in windows], quantiles),
+            "upstream_latency": weighted_percentiles([w.upstream_latency for w in windows], quantiles),
+        }
+
 
-# Configuración de rutas
-# Obtiene el directorio raíz del proyecto (dos niveles arriba de este archivo)
-PROJECT_ROOT = Path(__file__).parent.parent
-WWW_DIR = PROJECT_ROOT / "www"
-EXAMPLES_DIR = PROJECT_ROOT / "examples"
+class AccessLogTailer:
+    """
+    Lector incremental del access log JSON de nginx.
+    
+    Recuerda el offset leído, detecta truncado o rotación (cambio de
+    inode) y solo retorna líneas completas. Al abrir un log grande por
+    primera vez empieza por los últimos TAIL_START_BYTES.
+    
+    El archivo pertenece a root (lo escribe el master de nginx), así que
+    el host no lo trunca: cuando supera ACCESS_LOG_MAX_BYTES
+    (needs_rotation) el servidor lo rota con nginx y se lo indica al
+    tailer con follow_rotated(). Hasta que nginx crea el log nuevo, el
+    tailer sigue leyendo el archivo rotado desde su offset, de modo que no
+    se pierden las líneas que los workers escriben antes de reabrir.
+    
+    Attributes:
+        path (Path): Archivo de log
+    """
+    
+    TAIL_START_BYTES = 4 * 1024 * 1024
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._offset: Optional[int] = None
+        self._inode: Optional[int] = None
+        self._partial = b""
+        self._rotated: Optional[Path] = None
+    
+    def read_new(self) -> list[str]:
+        """
+        Lee las líneas nuevas desde la última llamada (bloqueante).
+        
+        Returns:
+            Líneas completas nuevas
+        """
+        lines = self._read_rotated() if self._rotated is not None else []
+        if self._rotated is not None:
+            return lines  # nginx aún no ha reabierto: el log nuevo no existe
+        
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return lines
+        
+        skip_first = False
+        if self._inode != stat.st_ino or self._offset is None:
+            first_open = self._offset is None
+            self._inode, self._partial = stat.st_ino, b""
+            self._offset = max(stat.st_size - self.TAIL_START_BYTES, 0) if first_open else 0
+            skip_first = self._offset > 0
+        elif stat.st_size < self._offset:
+            self._offset, self._partial = 0, b""  # truncado
+        
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read()
+            self._offset = f.tell()
+        
+        chunks = (self._partial + data).split(b"\n")
+        self._partial = chunks.pop()
+        if skip_first and chunks:
+            chunks.pop(0)  # primera línea posiblemente cortada
+        
+        return lines + [chunk.decode("utf-8", errors="replace") for chunk in chunks if chunk.strip()]
+    
+    def needs_rotation(self) -> bool:
+        """True si ya se leyó más de ACCESS_LOG_MAX_BYTES del archivo actual."""
+        return (self._rotated is None and self._offset is not None
+                and self._offset > ACCESS_LOG_MAX_BYTES)
+    
+    def follow_rotated(self, rotated: Path):
+        """
+        Indica que el log actual se renombró a 'rotated'.
+        
+        Las siguientes lecturas continúan en 'rotated' desde el offset
+        guardado hasta que aparece el log nuevo; entonces leen lo que
+        quede en 'rotated' y pasan al nuevo desde el principio.
+        
+        Args:
+            rotated: Ruta a la que se renombró el log
+        """
+        self._rotated = rotated
+    
+    def _read_rotated(self) -> list[str]:
+        try:
+            reopened = self.path.stat().st_ino != self._inode
+        except FileNotFoundError:
+            reopened = False
+        
+        # El log nuevo se comprueba antes de leer: lo escrito en el rotado
+        # antes de que nginx lo creara ya está en disco al leerlo
+        try:
+            with open(self._rotated, "rb") as f:
+                f.seek(self._offset or 0)
+                data = f.read()
+                self._offset = f.tell()
+        except OSError:
+            data, reopened = b"", True
+        
+        chunks = (self._partial + data).split(b"\n")
+        if reopened:
+            self._offset, self._inode, self._partial = 0, None, b""
+            self._rotated = None
+        else:
+            self._partial = chunks.pop()
+        return [chunk.decode("utf-8", errors="replace") for chunk in chunks if chunk.strip()]
 
-# Nombre del contenedor Docker
-CONTAINER_NAME = "mcp-web-server"
-DEFAULT_PORT = 8080
+
+class StateStore:
+    """
+    Almacén persistente del estado de los despliegues (SQLite en modo WAL).
+    
+    Registra sitios, contenedores, puertos reservados, versiones de
+    contenido (releases) e historial de tiempos, de modo que tras un
+    reinicio el servidor sabe qué desplegó sin consultar a Docker uno
+    por uno.
+    
+    Todas las operaciones se ejecutan en un único hilo dedicado, fuera
+    del event loop. Las escrituras se encolan sin esperar (fire-and-forget)
+    y el orden se conserva porque el hilo procesa la cola en FIFO.
+    
+    Attributes:
+        path (Path): Ruta del archivo SQLite
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sites (
+            name TEXT PRIMARY KEY,
+            www_dir TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS containers (
+            name TEXT PRIMARY KEY,
+            site TEXT NOT NULL,
+            container_id TEXT,
+            port INTEGER,
+            image TEXT,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS ports (
+            port INTEGER PRIMARY KEY,
+            container TEXT NOT NULL,
+            reserved_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS releases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS timings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            operation TEXT NOT NULL,
+            duration_ms REAL NOT NULL,
+            ok INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        );
+    """
+    
+    def __init__(self, path: Path):
+        """
+        Prepara el almacén. La conexión se abre en el primer uso.
+        
+        Args:
+            path: Ruta del archivo SQLite
+        """
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="state-store")
+    
+    # --- Ejecución fuera del event loop ---------------------------------
+    
+    def _db(self) -> sqlite3.Connection:
+        """Abre (una vez) la conexión SQLite en modo WAL. Solo en el hilo del almacén."""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+    
+    def _submit(self, fn, *args) -> asyncio.Future:
+        """
+        Encola una operación en el hilo del almacén.
+        
+        Los errores se reportan por stderr para que una escritura no
+        esperada nunca tumbe una herramienta.
+        
+        Returns:
+            Future con el resultado (se puede esperar o ignorar)
+        """
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        
+        def _report(fut: asyncio.Future):
+            if not fut.cancelled() and fut.exception() is not None:
+                print(f"⚠️ Error en state store: {fut.exception()}", file=sys.stderr)
+        
+        future.add_done_callback(_report)
+        return future
+    
+    @staticmethod
+    def _now() -> str:
+        return datetime.now().isoformat(timespec="seconds")
+    
+    # --- Operaciones síncronas (hilo del almacén) -----------------------
+    
+    def _write_deploy(self, site: str, www_dir: str, name: str,
+                      container_id: str, port: int, image: str):
+        db, now = self._db(), self._now()
+        with db:
+            db.execute(
+                "INSERT OR IGNORE INTO sites (name, www_dir, created_at) VALUES (?, ?, ?)",
+                (site, www_dir, now)
+            )
+            db.execute("DELETE FROM ports WHERE container = ?", (name,))
+            db.execute(
+                "INSERT OR REPLACE INTO ports (port, container, reserved_at) VALUES (?, ?, ?)",
+                (port, name, now)
+            )
+            db.execute(
+                "INSERT INTO containers (name, site, container_id, port, image, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'running', ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET site = excluded.site, "
+                "container_id = excluded.container_id, port = excluded.port, "
+                "image = excluded.image, status = 'running', "
+                "created_at = excluded.created_at, updated_at = excluded.updated_at",
+                (name, site, container_id, port, image, now, now)
+            )
+    
+    def _write_stop(self, name: str):
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM ports WHERE container = ?", (name,))
+            db.execute(
+                "UPDATE containers SET status = 'stopped', updated_at = ? WHERE name = ?",
+                (self._now(), name)
+            )
+    
+    def _write_release(self, site: str, filename: str, size: int, sha256: str):
+        db = self._db()
+        with db:
+            db.execute(
+                "INSERT INTO releases (site, filename, size, sha256, created_at) VALUES (?, ?, ?, ?, ?)",
+                (site, filename, size, sha256, self._now())
+            )
+    
+    def _write_timing(self, operation: str, duration_ms: float, ok: bool):
+        db = self._db()
+        with db:
+            db.execute(
+                "INSERT INTO timings (operation, duration_ms, ok, created_at) VALUES (?, ?, ?, ?)",
+                (operation, duration_ms, int(ok), self._now())
+            )
+    
+    def _read_containers(self) -> list[dict]:
+        rows = self._db().execute("SELECT * FROM containers ORDER BY name").fetchall()
+        return [dict(row) for row in rows]
+    
+    def _read_releases(self, site: str) -> list[dict]:
+        rows = self._db().execute(
+            "SELECT filename, size, sha256, created_at FROM releases WHERE site = ? ORDER BY id",
+            (site,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def _read_timings(self, operation: str) -> list[dict]:
+        rows = self._db().execute(
+            "SELECT duration_ms, ok, created_at FROM timings WHERE operation = ? ORDER BY id",
+            (operation,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def _write_reconcile(self, live: dict[str, dict]):
+        db, now = self._db(), self._now()
+        with db:
+            known = {row["name"] for row in db.execute("SELECT name FROM containers")}
+            
+            # Contenedores registrados que ya no existen en Docker
+            for name in known - live.keys():
+                db.execute("DELETE FROM ports WHERE container = ?", (name,))
+                db.execute(
+                    "UPDATE containers SET status = 'gone', updated_at = ? WHERE name = ?",
+                    (now, name)
+                )
+            
+            # Contenedores presentes en Docker: actualizar o adoptar
+            for name, info in live.items():
+                status = "running" if info["state"] == "running" else info["state"]
+                db.execute(
+                    "INSERT INTO containers (name, site, container_id, port, image, status, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET container_id = excluded.container_id, "
+                    "port = COALESCE(excluded.port, containers.port), "
+                    "status = excluded.status, updated_at = excluded.updated_at",
+                    (name, info.get("site", DEFAULT_SITE), info["id"], info["port"], info.get("image"),
+                     status, now, now)
+                )
+                db.execute("DELETE FROM ports WHERE container = ?", (name,))
+                if status == "running" and info["port"] is not None:
+                    db.execute(
+                        "INSERT OR REPLACE INTO ports (port, container, reserved_at) VALUES (?, ?, ?)",
+                        (info["port"], name, now)
+                    )
+    
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
+    # --- API asíncrona --------------------------------------------------
+    
+    def record_deploy(self, site: str, www_dir: Path, name: str,
+                      container_id: str, port: int, image: str) -> asyncio.Future:
+        """Registra un contenedor desplegado y su puerto."""
+        return self._submit(self._write_deploy, site, str(www_dir), name, container_id, port, image)
+    
+    def record_stop(self, name: str) -> asyncio.Future:
+        """Marca un contenedor como detenido y libera su puerto."""
+        return self._submit(self._write_stop, name)
+    
+    def record_release(self, site: str, filename: str, content: str) -> asyncio.Future:
+        """Registra una nueva versión de un archivo del sitio."""
+        data = content.encode("utf-8")
+        return self._submit(
+            self._write_release, site, filename, len(data), hashlib.sha256(data).hexdigest()
+        )
+    
+    def record_timing(self, operation: str, duration_ms: float, ok: bool) -> asyncio.Future:
+        """Añade una medición al historial de tiempos."""
+        return self._submit(self._write_timing, operation, duration_ms, ok)
+    
+    def reconcile(self, live: dict[str, dict]) -> asyncio.Future:
+        """
+        Sincroniza el estado guardado con los contenedores reales.
+        
+        Args:
+            live: Contenedores según Docker, nombre -> {id, state, port}
+        """
+        return self._submit(self._write_reconcile, live)
+    
+    async def containers(self) -> list[dict]:
+        """Contenedores conocidos con su último estado."""
+        return await self._submit(self._read_containers)
+    
+    async def releases(self, site: str = DEFAULT_SITE) -> list[dict]:
+        """Historial de versiones de contenido de un sitio."""
+        return await self._submit(self._read_releases, site)
+    
+    async def timings(self, operation: str) -> list[dict]:
+        """Historial de tiempos de una operación."""
+        return await self._submit(self._read_timings, operation)
+    
+    async def flush(self):
+        """Espera a que se completen todas las escrituras encoladas."""
+        await self._submit(lambda: None)
+    
+    def close(self):
+        """Cierra la conexión y detiene el hilo del almacén."""
+        self._executor.submit(self._close)
+        self._executor.shutdown(wait=True)
+
+
+def http_security_settings(host: str, port: int):
+    """
+    Protección contra DNS rebinding para el modo http.
+    
+    Sin ella, una página web cualquiera podría apuntar un dominio propio a
+    127.0.0.1 y, desde el navegador del usuario, llamar a deploy_server o
+    create_html. Solo se aceptan peticiones cuyo Host (y Origin, si lo
+    envía un navegador) sea la dirección de escucha o localhost.
+    
+    Args:
+        host: Dirección de escucha
+        port: Puerto de escucha
+    
+    Returns:
+        TransportSecuritySettings para los transportes streamable HTTP y SSE
+    """
+    from mcp.server.transport_security import TransportSecuritySettings
+    
+    hosts = list(dict.fromkeys([f"{host}:{port}", f"localhost:{port}", f"127.0.0.1:{port}"]))
+    return TransportSecuritySettings(
+        enable_dns_rebinding_protection=True,
+        allowed_hosts=hosts,
+        allowed_origins=[f"http://{h}" for h in hosts],
+    )
+
+
+class Site:
+    """
+    Sitio servido por un contenedor, con su caché y su tráfico propios.
+    
+    El sitio por defecto sirve www/ desde CONTAINER_NAME; el resto (uno
+    por sesión en modo http) sirve sites/<nombre>/ desde
+    CONTAINER_NAME-<nombre>.
+    
+    Attributes:
+        name (str): Nombre del sitio
+        cache_port (int | None): Puerto del servidor si tiene la caché activa
+        traffic (TrafficAnalyzer): Analítica del access log del sitio
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.cache_port: Optional[int] = None
+        self.traffic = TrafficAnalyzer()
+        self.access_log = AccessLogTailer(LOGS_DIR / self.container / ACCESS_LOG_NAME)
+    
+    @property
+    def container(self) -> str:
+        """Nombre del contenedor Docker del sitio."""
+        if self.name == DEFAULT_SITE:
+            return CONTAINER_NAME
+        return f"{CONTAINER_NAME}-{self.name}"
+    
+    @property
+    def www_dir(self) -> Path:
+        """Directorio con los archivos HTML del sitio."""
+        if self.name == DEFAULT_SITE:
+            return WWW_DIR
+        return SITES_DIR / self.name
+    
+    @staticmethod
+    def name_of(container: str) -> Optional[str]:
+        """
+        Obtiene el nombre del sitio a partir del nombre del contenedor.
+        
+        Returns:
+            Nombre del sitio o None si el contenedor no es del deployer
+        """
+        if container == CONTAINER_NAME:
+            return DEFAULT_SITE
+        prefix = f"{CONTAINER_NAME}-"
+        if container.startswith(prefix) and re.match(SITE_NAME_PATTERN, container[len(prefix):]):
+            return container[len(prefix):]
+        return None
 
 
 class WebDeployerServer:
@@ -54,19 +1603,52 @@ class WebDeployerServer:
     
     Attributes:
         server (Server): Instancia del servidor MCP
+        image_state (str): Estado de la imagen Docker
+            (unknown, checking, loading, pulling, ready, error)
+        state (StateStore): Estado persistente de los despliegues
+        ports (PortAllocator): Tabla de reservas de puertos
+        executor (CommandExecutor): Ejecutor de comandos Docker
+        sites (dict[str, Site]): Sitios conocidos, por nombre
+        transport (str): Transporte en uso ("stdio" o "http")
     """
     
     def __init__(self):
         """
-        Inicializa el servidor MCP y configura el entorno.
+        Inicializa el servidor sin trabajo costoso.
+        
+        Solo se crean objetos en memoria. El SDK de MCP y los manejadores
+        de herramientas se cargan en el primer acceso a 'server'; los
+        directorios, la imagen Docker y la reconciliación del estado se
+        preparan en segundo plano desde run(). El almacén de estado abre
+        la base de datos en su primer uso.
+        """
+        self._server = None
+        self._background: list[asyncio.Task] = []
+        self.state = StateStore(STATE_DB)
+        self.ports = PortAllocator.from_range(PORT_RANGE)
+        self.executor = CommandExecutor()
+        self.sites: dict[str, Site] = {DEFAULT_SITE: Site(DEFAULT_SITE)}
+        self.transport = "stdio"
+        self._session_sites: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._flights = SingleFlight()
+        self.image_state = "unknown"
+        self._image_ref = image_reference()
+        self._image_task: Optional[asyncio.Task] = None
+    
+    @property
+    def server(self) -> Server:
+        """
+        Servidor MCP del SDK, creado (con sus herramientas) en el primer uso.
         
-        - Crea el servidor MCP con nombre identificador
-        - Asegura que existan los directorios necesarios
-        - Registra los manejadores de herramientas
+        Returns:
+            Instancia de mcp.server.Server
         """
-        self.server = Server("web-deployer")
-        self._ensure_directories()
-        self._setup_handlers()
+        if self._server is None:
+            from mcp.server import Server
+            self._server = Server(SERVER_NAME, version=SERVER_VERSION)
+            self._setup_handlers()
+        return self._server
     
     def _ensure_directories(self):
         """
@@ -93,6 +1675,7 @@ class WebDeployerServer:
         Cada handler es una función asíncrona decorada que responde
         a solicitudes específicas del cliente MCP (Claude Desktop).
         """
+        from mcp.types import Tool
         
         @self.server.list_tools()
         async def list_tools() -> list[Tool]:
@@ -108,7 +1691,7 @@ class WebDeployerServer:
             Returns:
                 Lista de objetos Tool con todas las herramientas disponibles
             """
-            return [
+            tools = [
                 Tool(
                     name="create_html",
                     description=(
@@ -137,15 +1720,66 @@ class WebDeployerServer:
                     description=(
                         "Despliega un servidor web Nginx en Docker para servir "
                         "los archivos HTML del directorio www/. El servidor será "
-                        "accesible en http://localhost:PORT (default: 8080)"
+                        "accesible en http://localhost:PORT. Si no se indica "
+                        "puerto se asigna uno libre automáticamente."
                     ),
                     inputSchema={
                         "type": "object",
                         "properties": {
                             "port": {
                                 "type": "integer",
-                                "description": "Puerto donde exponer el servidor",
-                                "default": DEFAULT_PORT,
+                                "description": (
+                                    "Puerto donde exponer el servidor. "
+                                    "Opcional: si se omite se asigna uno libre"
+                                ),
+                                "minimum": 1024,
+                                "maximum": 65535
+                            },
+                            "health_path": {
+                                "type": "string",
+                                "description": (
+                                    "Ruta HTTP para comprobar que el servidor responde "
+                                    "antes de retornar (default: /)"
+                                ),
+                                "pattern": HEALTH_PATH_PATTERN
+                            },
+                            "ready_timeout": {
+                                "type": "number",
+                                "description": "Segundos máximos de espera hasta que responda",
+                                "minimum": 0,
+                                "maximum": 120
+                            },
+                            "cache": {
+                                "type": "boolean",
+                                "description": (
+                                    "Activa una caché HTTP en memoria delante del sitio "
+                                    "(las páginas se purgan al reescribirlas con create_html)"
+                                ),
+                                "default": False
+                            },
+                            "cache_size_mb": {
+                                "type": "integer",
+                                "description": f"Tamaño de la caché en MB (default: {CACHE_SIZE_MB})",
+                                "minimum": 1,
+                                "maximum": 4096
+                            },
+                            "cache_ttl": {
+                                "type": "integer",
+                                "description": f"Segundos que una página se sirve desde caché (default: {CACHE_TTL})",
+                                "minimum": 1,
+                                "maximum": 86400
+                            },
+                            "tls": {
+                                "type": "boolean",
+                                "description": (
+                                    "Sirve también HTTPS con HTTP/2 usando un certificado "
+                                    "de una CA local generada automáticamente"
+                                ),
+                                "default": False
+                            },
+                            "tls_port": {
+                                "type": "integer",
+                                "description": "Puerto HTTPS. Opcional: si se omite se asigna uno libre",
                                 "minimum": 1024,
                                 "maximum": 65535
                             }
@@ -184,42 +1818,400 @@ class WebDeployerServer:
                         "type": "object",
                         "properties": {}
                     }
+                ),
+                Tool(
+                    name="purge_cache",
+                    description=(
+                        "Purga rutas de la caché HTTP del servidor web para que la "
+                        "siguiente visita reciba el contenido actual. Solo aplica si "
+                        "el servidor se desplegó con cache=true."
+                    ),
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "paths": {
+                                "type": "array",
+                                "items": {"type": "string", "pattern": HEALTH_PATH_PATTERN},
+                                "description": "Rutas a purgar (ej: [\"/\", \"/about.html\"])",
+                                "default": ["/"]
+                            }
+                        }
+                    }
+                ),
+                Tool(
+                    name="site_traffic",
+                    description=(
+                        "Analítica de tráfico del sitio desplegado a partir del access "
+                        "log de nginx: peticiones, códigos de estado, rutas más "
+                        "visitadas, bytes servidos y percentiles de latencia."
+                    ),
+                    inputSchema={
+                        "type": "object",
+                        "properties": {
+                            "window_minutes": {
+                                "type": "integer",
+                                "description": "Minutos hacia atrás a analizar (default: 15)",
+                                "default": 15,
+                                "minimum": 1,
+                                "maximum": 60
+                            },
+                            "top": {
+                                "type": "integer",
+                                "description": "Número de rutas en el ranking (default: 10)",
+                                "default": 10,
+                                "minimum": 1,
+                                "maximum": 32
+                            }
+                        }
+                    }
                 )
             ]
+            
+            # Todas las herramientas aceptan 'format' (text | json)
+            for tool in tools:
+                tool.inputSchema["properties"]["format"] = FORMAT_PROPERTY
+            return tools
+        
+        @self.server.call_tool()
+        async def call_tool(name: str, arguments: Any) -> list[TextContent]:
+            """
+            Ejecuta una herramienta específica cuando Claude la invoca.
+            
+            Este es el dispatcher principal que recibe todas las invocaciones
+            de herramientas y las redirige al método apropiado.
+            
+            Args:
+                name: Nombre de la herramienta a ejecutar
+                arguments: Diccionario con los parámetros de entrada
+            
+            Returns:
+                Lista de TextContent con los resultados de la ejecución
+                
+            Raises:
+                ValueError: Si la herramienta no existe
+            """
+            # Mapeo de nombres de herramientas a métodos
+            tool_map = {
+                "create_html": self._create_html,
+                "deploy_server": self._deploy_server,
+                "stop_server": self._stop_server,
+                "server_status": self._server_status,
+                "list_html_files": self._list_html_files,
+                "purge_cache": self._purge_cache,
+                "site_traffic": self._site_traffic,
+            }
+            
+            # Validar que la herramienta existe
+            if name not in tool_map:
+                raise ValueError(f"Herramienta desconocida: {name}")
+            
+            # Ejecutar la herramienta correspondiente
+            return await tool_map[name](arguments)
+    
+    def _lock(self, container: str) -> asyncio.Lock:
+        """Lock que serializa las operaciones que modifican un contenedor."""
+        if container not in self._locks:
+            self._locks[container] = asyncio.Lock()
+        return self._locks[container]
+    
+    def _get_site(self, name: str) -> Site:
+        """Obtiene (o crea) el sitio con ese nombre."""
+        if name not in self.sites:
+            self.sites[name] = Site(name)
+        return self.sites[name]
+    
+    def _site(self) -> Site:
+        """
+        Sitio sobre el que actúa la petición en curso.
+        
+        En stdio hay un único cliente y se usa el sitio por defecto. En
+        modo http cada sesión MCP queda ligada a un sitio la primera vez
+        que llama a una herramienta: el indicado en la cabecera X-MCP-Site
+        o uno nuevo con nombre aleatorio (anónimo), que se libera al
+        cerrar la sesión.
+        
+        Returns:
+            Sitio de la sesión actual
+        """
+        if self.transport != "http":
+            return self.sites[DEFAULT_SITE]
+        try:
+            ctx = self.server.request_context
+        except LookupError:
+            return self.sites[DEFAULT_SITE]
+        
+        name = self._session_sites.get(ctx.session)
+        if name is None:
+            headers = getattr(ctx.request, "headers", None) or {}
+            requested = headers.get(SITE_HEADER, "").lower()
+            anonymous = not re.match(SITE_NAME_PATTERN, requested)
+            name = secrets.token_hex(4) if anonymous else requested
+            self._session_sites[ctx.session] = name
+            state = _SESSION_STATE.get(None)
+            if state is not None:
+                state.update(session=ctx.session, site=name, anonymous=anonymous)
+        return self._get_site(name)
+    
+    async def _run_session(self, read_stream, write_stream, options, **kwargs):
+        """
+        Ejecuta una sesión MCP del modo http y libera su sitio al terminar.
+        
+        La sesión termina cuando el cliente la cierra (o corta la conexión
+        SSE), cuando el SDK la da por caducada o al parar el servidor. Los sitios con nombre
+        (X-MCP-Site) se conservan para recuperarlos al reconectar.
+        
+        Args:
+            read_stream: Mensajes del cliente
+            write_stream: Mensajes hacia el cliente
+            options: Opciones de inicialización del servidor MCP
+            **kwargs: Resto de argumentos de Server.run
+        """
+        state: dict = {}
+        token = _SESSION_STATE.set(state)
+        try:
+            await self.server.run(read_stream, write_stream, options, **kwargs)
+        finally:
+            _SESSION_STATE.reset(token)
+            if state.get("anonymous"):
+                self._session_sites.pop(state["session"], None)
+                import anyio
+                with anyio.CancelScope(shield=True):
+                    await self._release_site(state["site"])
+    
+    async def _release_site(self, name: str):
+        """
+        Elimina un sitio anónimo: su contenedor, sus puertos y sus archivos.
+        
+        No hace nada si otra sesión abierta sigue usando el sitio.
+        
+        Args:
+            name: Nombre del sitio
+        """
+        site = self.sites.get(name)
+        if site is None or name in self._session_sites.values():
+            return
+        container = site.container
+        try:
+            async with self._lock(container):
+                if self.ports.port_of(container) is not None:
+                    await self.executor.run(["docker", "rm", "-f", container])
+                    self.ports.release(container)
+                    self.ports.release(f"{container}:tls")
+                    self.state.record_stop(container)
+                self.sites.pop(name, None)
+                loop = asyncio.get_running_loop()
+                for path in (site.www_dir, LOGS_DIR / container):
+                    await loop.run_in_executor(None, shutil.rmtree, path, True)
+        except Exception as e:
+            print(f"⚠️ No se pudo liberar el sitio {name}: {e}", file=sys.stderr)
+    
+    def _wants_json(self, args: Optional[dict]) -> bool:
+        """
+        Decide si la respuesta se devuelve como JSON compacto.
+        
+        Prioridad: argumento 'format' de la llamada, capacidad experimental
+        anunciada por el cliente al inicializar y MCP_WEB_RESPONSE_FORMAT.
+        
+        Args:
+            args: Argumentos de la herramienta (pueden ser None)
+        
+        Returns:
+            True si debe usarse JSON
+        """
+        fmt = (args or {}).get("format")
+        if fmt:
+            return fmt == "json"
+        try:
+            params = self.server.request_context.session.client_params
+            experimental = params.capabilities.experimental or {}
+            if COMPACT_CAPABILITY in experimental:
+                return True
+        except (LookupError, AttributeError):
+            # Fuera de una petición MCP (tests, llamadas internas)
+            pass
+        return RESPONSE_FORMAT == "json"
+    
+    def _reply(self, args: Optional[dict], tool: str, ok: bool, text: str, **data) -> list[TextContent]:
+        """
+        Construye la respuesta de una herramienta en el formato pedido.
+        
+        Args:
+            args: Argumentos de la herramienta (para leer 'format')
+            tool: Nombre de la herramienta
+            ok: Si la operación tuvo éxito
+            text: Mensaje legible (formato "text")
+            **data: Campos de la respuesta JSON
+        
+        Returns:
+            Lista con un TextContent
+        """
+        from mcp.types import TextContent
+        if self._wants_json(args):
+            text = compact_json({"ok": ok, "tool": tool, **data})
+        return [TextContent(type="text", text=text)]
+    
+    def _list_html_chunks(self, html_files: list[Path]) -> list[TextContent]:
+        """
+        Lista los archivos HTML como JSON compacto en trozos.
+        
+        Cada TextContent lleva como mucho LIST_CHUNK_SIZE archivos e indica
+        su posición ('chunk', 'chunks') y el total, de modo que el cliente
+        puede procesarlos a medida que llegan.
+        
+        Args:
+            html_files: Archivos a listar
+        
+        Returns:
+            Lista de TextContent, uno por trozo
+        """
+        from mcp.types import TextContent
+        files = []
+        for file in sorted(html_files):
+            stat = file.stat()
+            files.append({"name": file.name, "size": stat.st_size, "mtime": int(stat.st_mtime)})
+        
+        chunks = [files[i:i + LIST_CHUNK_SIZE] for i in range(0, len(files), LIST_CHUNK_SIZE)]
+        return [
+            TextContent(
+                type="text",
+                text=compact_json({
+                    "ok": True,
+                    "tool": "list_html_files",
+                    "chunk": index,
+                    "chunks": len(chunks),
+                    "total": len(files),
+                    "files": chunk,
+                })
+            )
+            for index, chunk in enumerate(chunks)
+        ]
+    
+    async def _prepare_image(self) -> bool:
+        """
+        Asegura que la imagen del servidor web esté disponible localmente.
         
-        @self.server.call_tool()
-        async def call_tool(name: str, arguments: Any) -> list[TextContent]:
-            """
-            Ejecuta una herramienta específica cuando Claude la invoca.
+        Proceso:
+        1. Comprueba si la imagen ya existe ('docker image inspect')
+        2. Si no existe y hay tarball configurado, lo carga ('docker load')
+        3. En otro caso, descarga la imagen ('docker pull')
+        
+        Las imágenes cargadas desde tarball no conservan el digest del
+        registro, así que en ese caso se usa el tag de MCP_WEB_IMAGE.
+        
+        Returns:
+            True si la imagen quedó lista para 'docker run'
+        """
+        try:
+            self.image_state = "checking"
+            inspect = await self.executor.run(["docker", "image", "inspect", self._image_ref])
+            if inspect.ok:
+                self.image_state = "ready"
+                return True
             
-            Este es el dispatcher principal que recibe todas las invocaciones
-            de herramientas y las redirige al método apropiado.
+            tarball = Path(NGINX_IMAGE_TARBALL) if NGINX_IMAGE_TARBALL else None
+            if tarball is not None and tarball.is_file():
+                self.image_state = "loading"
+                load = await self.executor.run(["docker", "load", "-i", str(tarball)])
+                if load.ok:
+                    self._image_ref = NGINX_IMAGE
+                    self.image_state = "ready"
+                    return True
             
-            Args:
-                name: Nombre de la herramienta a ejecutar
-                arguments: Diccionario con los parámetros de entrada
+            self.image_state = "pulling"
+            pull = await self.executor.run(["docker", "pull", self._image_ref])
+            self.image_state = "ready" if pull.ok else "error"
+            return pull.ok
+        except Exception:
+            self.image_state = "error"
+            return False
+    
+    def _start_image_prewarm(self) -> asyncio.Task:
+        """
+        Lanza (una sola vez) la preparación de la imagen en segundo plano.
+        
+        Se llama al arrancar el servidor para que el primer 'deploy_server'
+        no tenga que esperar la descarga de la imagen.
+        
+        Returns:
+            Tarea asyncio compartida con el resultado de _prepare_image()
+        """
+        if self._image_task is None:
+            self._image_task = asyncio.create_task(self._prepare_image())
+        return self._image_task
+    
+    async def _ensure_image(self) -> bool:
+        """
+        Espera a que la imagen esté lista, reutilizando el pre-calentamiento.
+        
+        Si la preparación anterior falló se reintenta en la siguiente llamada.
+        
+        Returns:
+            True si la imagen está disponible localmente
+        """
+        task = self._start_image_prewarm()
+        ready = await asyncio.shield(task)
+        if not ready:
+            self._image_task = None
+        return ready
+    
+    async def _reconcile_state(self) -> bool:
+        """
+        Reconcilia el almacén de estado con Docker al arrancar.
+        
+        Usa una sola consulta 'docker ps -a' para todos los contenedores
+        del deployer (incluidos los detenidos), de modo que ningún
+        contenedor queda huérfano ni se guarda como activo si ya no existe.
+        
+        Returns:
+            True si se pudo consultar a Docker
+        """
+        try:
+            ps = await self.executor.run([
+                "docker", "ps", "-a",
+                "--filter", f"name={CONTAINER_NAME}",
+                "--format", "{{.Names}}|{{.ID}}|{{.State}}|{{.Ports}}|{{.Image}}",
+            ])
+            if not ps.ok:
+                return False
             
-            Returns:
-                Lista de TextContent con los resultados de la ejecución
-                
-            Raises:
-                ValueError: Si la herramienta no existe
-            """
-            # Mapeo de nombres de herramientas a métodos
-            tool_map = {
-                "create_html": self._create_html,
-                "deploy_server": self._deploy_server,
-                "stop_server": self._stop_server,
-                "server_status": self._server_status,
-                "list_html_files": self._list_html_files,
-            }
+            live = {}
+            for line in ps.stdout.splitlines():
+                parts = line.split("|")
+                if len(parts) < 5:
+                    continue
+                name, container_id, state, ports, image = parts[:5]
+                site = Site.name_of(name)
+                if site is None:
+                    continue
+                live[name] = {
+                    "site": site,
+                    "id": container_id[:12],
+                    "state": state,
+                    "port": parse_host_port(ports, 80),
+                    "tls_port": parse_host_port(ports, 443),
+                    "image": image,
+                }
             
-            # Validar que la herramienta existe
-            if name not in tool_map:
-                raise ValueError(f"Herramienta desconocida: {name}")
+            await self.state.reconcile(live)
             
-            # Ejecutar la herramienta correspondiente
-            return await tool_map[name](arguments)
+            # Restaurar los sitios, las reservas y la caché de los
+            # contenedores activos. Si hay caché se sabe por la configuración
+            # de nginx montada en el contenedor, que sigue en runtime/
+            for name, info in live.items():
+                if info["state"] == "running":
+                    site = self._get_site(info["site"])
+                    conf_file = RUNTIME_DIR / f"{name}.conf"
+                    if (info["port"] is not None and conf_file.exists()
+                            and "proxy_cache_path" in conf_file.read_text(encoding="utf-8")):
+                        site.cache_port = info["port"]
+                if info["state"] == "running" and info["port"] is not None:
+                    self.ports.adopt(name, info["port"])
+                if info["state"] == "running" and info["tls_port"] is not None:
+                    self.ports.adopt(f"{name}:tls", info["tls_port"])
+            return True
+        except Exception as e:
+            print(f"⚠️ No se pudo reconciliar el estado: {e}", file=sys.stderr)
+            return False
     
     async def _create_html(self, args: dict) -> list[TextContent]:
         """
@@ -243,136 +2235,284 @@ class WebDeployerServer:
         if not filename.endswith(".html"):
             filename += ".html"
         
-        # Construir ruta completa
-        file_path = WWW_DIR / filename
+        # Construir ruta completa dentro del sitio de la sesión
+        site = self._site()
+        file_path = site.www_dir / filename
         
         try:
             # Escribir contenido al archivo
+            site.www_dir.mkdir(parents=True, exist_ok=True)
             file_path.write_text(content, encoding="utf-8")
+            self.state.record_release(site.name, filename, content)
             
-            # Retornar confirmación con información útil
-            return [
-                TextContent(
-                    type="text",
-                    text=(
-                        f"✅ Archivo HTML creado exitosamente\n\n"
-                        f"📄 Archivo: {filename}\n"
-                        f"📍 Ruta: {file_path}\n"
-                        f"📊 Tamaño: {len(content)} caracteres\n"
-                        f"🕐 Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-                        f"💡 Para ver el archivo, despliega el servidor con 'deploy_server'"
-                    )
+            # Con caché activa, la versión anterior no debe seguir sirviéndose
+            purge_line, purged = "", []
+            if site.cache_port is not None:
+                paths = [f"/{filename}"] + (["/"] if filename == "index.html" else [])
+                purged = [
+                    path for path, ok in (await self._purge_paths(site.cache_port, paths)).items() if ok
+                ]
+                purge_line = (
+                    f"♻️ Caché purgada: {', '.join(purged)}\n" if purged
+                    else "⚠️ No se pudo purgar la caché (usa 'purge_cache')\n"
                 )
-            ]
+            
+            # Retornar confirmación con información útil
+            return self._reply(
+                args, "create_html", True,
+                (
+                    f"✅ Archivo HTML creado exitosamente\n\n"
+                    f"📄 Archivo: {filename}\n"
+                    f"📍 Ruta: {file_path}\n"
+                    f"📊 Tamaño: {len(content)} caracteres\n"
+                    f"🕐 Timestamp: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"{purge_line}\n"
+                    f"💡 Para ver el archivo, despliega el servidor con 'deploy_server'"
+                ),
+                file=filename, size=len(content), purged=purged
+            )
         except Exception as e:
-            return [
-                TextContent(
-                    type="text",
-                    text=f"❌ Error al crear archivo: {str(e)}"
-                )
-            ]
+            return self._reply(
+                args, "create_html", False,
+                f"❌ Error al crear archivo: {str(e)}",
+                error=str(e)
+            )
     
     async def _deploy_server(self, args: dict) -> list[TextContent]:
         """
         Despliega un servidor web Nginx en Docker.
         
         Proceso detallado:
-        1. Obtiene el puerto de configuración
-        2. Detiene cualquier contenedor previo
-        3. Inicia nuevo contenedor Nginx con:
-           - Imagen: nginx:alpine (ligera y segura)
+        1. Reserva el puerto (comprobando que el host lo puede enlazar)
+        2. Prepara certificado TLS y configuración de nginx; si algo falla
+           aquí, el contenedor previo no se toca
+        3. Detiene cualquier contenedor previo
+        4. Espera a que la imagen esté disponible (pre-calentada al arrancar)
+        5. Inicia nuevo contenedor Nginx con:
+           - Imagen: configurable (default: nginx:alpine, ligera y segura)
            - Puerto mapeado: host:container
            - Volumen: www/ montado en /usr/share/nginx/html (read-only)
-        4. Verifica que el contenedor inició correctamente
+           - HEALTHCHECK de Docker sobre la misma ruta de salud
+           - Opcional: caché HTTP en memoria delante del sitio
+           - Opcional: HTTPS + HTTP/2 con certificado de la CA local
+        6. Verifica que el contenedor inició correctamente
+        7. Espera a que nginx responda (TCP + HTTP GET con backoff)
         
         Args:
-            args: Diccionario con 'port' opcional
+            args: Diccionario con 'port', 'health_path', 'ready_timeout',
+                'cache', 'cache_size_mb', 'cache_ttl', 'tls' y 'tls_port' opcionales
         
         Returns:
             Lista con TextContent del resultado del despliegue
         """
-        port = args.get("port", DEFAULT_PORT)
+        health_path = args.get("health_path", HEALTH_PATH)
+        ready_timeout = float(args.get("ready_timeout", READY_TIMEOUT))
+        cache = bool(args.get("cache", False))
+        cache_size_mb = int(args.get("cache_size_mb", CACHE_SIZE_MB))
+        cache_ttl = int(args.get("cache_ttl", CACHE_TTL))
+        tls = bool(args.get("tls", False))
+        site = self._site()
+        container = site.container
+        tls_owner = f"{container}:tls"
+        started = time.perf_counter()
         
-        try:
-            # Paso 1: Limpiar contenedores previos
-            # Usamos 2>nul & para ignorar errores si no existe el contenedor
-            cleanup_cmd = (
-                f'docker stop {CONTAINER_NAME} 2>nul & '
-                f'docker rm {CONTAINER_NAME} 2>nul & '
-                f'echo.'  # Comando dummy para evitar error
+        # La ruta de salud acaba dentro del comando del HEALTHCHECK
+        if not re.match(HEALTH_PATH_PATTERN, health_path):
+            return self._reply(
+                args, "deploy_server", False,
+                f"❌ Ruta de salud inválida: {health_path}",
+                error=f"invalid health_path: {health_path}"
             )
+        
+        # Un solo deploy/stop a la vez por contenedor: dos despliegues
+        # solapados intercalarían sus 'rm'/'run' sobre el mismo nombre
+        async with self._lock(container):
+            # Reservar el puerto antes de tocar Docker: un conflicto se
+            # detecta en microsegundos en lugar de tras arrancar el contenedor
+            previous = {
+                owner: self.ports.port_of(owner) for owner in (container, tls_owner)
+            }
             
-            proc = await asyncio.create_subprocess_shell(
-                cleanup_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            await proc.communicate()
-            
-            # Paso 2: Obtener ruta absoluta del directorio www/
-            # Docker requiere rutas absolutas para volúmenes
-            www_abs = WWW_DIR.absolute()
-            
-            # Convertir ruta de Windows a formato Docker
-            # C:\MCP\MCP-Despliegues\mcp-web-deployer\... -> /c/MCP/MCP-Despliegues/mcp-web-deployer/...
-            www_docker = str(www_abs).replace("\\", "/").replace("C:", "/c")
-            
-            # Paso 3: Construir comando Docker
-            docker_cmd = (
-                f'docker run -d '
-                f'--name {CONTAINER_NAME} '
-                f'-p {port}:80 '
-                f'-v "{www_docker}:/usr/share/nginx/html:ro" '
-                f'nginx:alpine'
-            )
+            def restore_reservations():
+                # Dejar las reservas como estaban antes de este intento
+                for owner, previous_port in previous.items():
+                    if previous_port is None:
+                        self.ports.release(owner)
+                    else:
+                        self.ports.adopt(owner, previous_port)
             
-            # Ejecutar comando Docker
-            proc = await asyncio.create_subprocess_shell(
-                docker_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            try:
+                port = self.ports.reserve(container, args.get("port"))
+                if tls:
+                    tls_port = self.ports.reserve(tls_owner, args.get("tls_port"))
+                else:
+                    self.ports.release(tls_owner)
+            except PortUnavailableError as e:
+                restore_reservations()
+                return self._reply(
+                    args, "deploy_server", False,
+                    (
+                        f"❌ Puerto no disponible\n\n"
+                        f"Detalles: {e}\n\n"
+                        f"💡 Omite 'port' para asignar uno libre automáticamente"
+                    ),
+                    error=str(e)
+                )
+            
+            # Paso 1: Preparar todo lo que puede fallar (certificado TLS,
+            # directorios, configuración de nginx) antes de tocar el
+            # contenedor actual: si algo falla, el sitio sigue sirviendo
+            try:
+                if tls:
+                    # Solo se monta el certificado del sitio; la clave de la CA no sale del host
+                    loop = asyncio.get_running_loop()
+                    site_certs, ca_cert = await loop.run_in_executor(
+                        None, ensure_site_certificate, container
+                    )
+                
+                # Docker requiere rutas absolutas para volúmenes
+                www_abs = site.www_dir.absolute()
+                www_abs.mkdir(parents=True, exist_ok=True)
+                
+                # Configuración de nginx generada (access log JSON y caché
+                # opcional) y directorio donde nginx escribe el access log
+                log_dir = LOGS_DIR / container
+                log_dir.mkdir(parents=True, exist_ok=True)
+                conf_file = RUNTIME_DIR / f"{container}.conf"
+                conf_file.parent.mkdir(parents=True, exist_ok=True)
+                conf_file.write_text(
+                    render_nginx_conf(cache_size_mb if cache else None, cache_ttl, tls),
+                    encoding="utf-8"
+                )
+            except Exception as e:
+                restore_reservations()
+                return self._reply(
+                    args, "deploy_server", False,
+                    (
+                        f"❌ No se pudo preparar el despliegue\n\n"
+                        f"Detalles: {str(e)}\n\n"
+                        f"💡 El servidor anterior (si lo había) sigue activo"
+                    ),
+                    error=str(e)
+                )
             
-            stdout, stderr = await proc.communicate()
+            nginx_args = [
+                "-v", f"{docker_volume_path(conf_file)}:/etc/nginx/conf.d/default.conf:ro",
+                "-v", f"{docker_volume_path(log_dir)}:{ACCESS_LOG_DIR}",
+            ]
+            if cache:
+                nginx_args += ["--tmpfs", f"{CACHE_PATH}:rw,size={cache_size_mb}m"]
+            if tls:
+                nginx_args += [
+                    "-p", f"{tls_port}:443",
+                    "-v", f"{docker_volume_path(site_certs)}:{CERTS_MOUNT}:ro",
+                ]
             
-            # Verificar resultado
-            if proc.returncode == 0:
-                container_id = stdout.decode().strip()[:12]
-                return [
-                    TextContent(
-                        type="text",
-                        text=(
+            try:
+                # Paso 2: Limpiar el contenedor previo y asegurar la imagen.
+                # Son independientes, así que se ejecutan en paralelo. 'rm -f'
+                # falla si no existe el contenedor, lo cual es correcto aquí.
+                # Si la imagen falla, 'docker run' intentará descargarla y
+                # reportará el error correspondiente.
+                await asyncio.gather(
+                    self.executor.run(["docker", "rm", "-f", container]),
+                    self._ensure_image()
+                )
+                
+                # Paso 3: Construir y ejecutar el comando Docker
+                run = await self.executor.run([
+                    "docker", "run", "-d",
+                    "--name", container,
+                    "-p", f"{port}:80",
+                    "-v", f"{docker_volume_path(www_abs)}:/usr/share/nginx/html:ro",
+                    *nginx_args,
+                    *health_check_args(self._image_ref, health_path),
+                    self._image_ref,
+                ])
+                site.cache_port = port if run.ok and cache else None
+                
+                # Verificar resultado
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                self.state.record_timing("deploy_server", elapsed_ms, run.ok)
+                if run.ok:
+                    container_id = run.stdout[:12]
+                    self.state.record_deploy(
+                        site.name, www_abs, container, container_id, port, self._image_ref
+                    )
+                    
+                    # Paso 4: No retornar hasta que nginx sirva realmente
+                    ready_after = await wait_until_ready(port, health_path, ready_timeout)
+                    if ready_after is None:
+                        return self._reply(
+                            args, "deploy_server", True,
+                            (
+                                f"⚠️ Contenedor iniciado pero el servidor aún no responde\n\n"
+                                f"🆔 Container ID: {container_id}\n"
+                                f"🔌 Puerto: {port}\n"
+                                f"🩺 Ruta de salud: {health_path}\n"
+                                f"⏱️ Sin respuesta tras {ready_timeout:g} s\n\n"
+                                f"💡 Consulta 'server_status' en unos segundos"
+                            ),
+                            site=site.name, container=container, container_id=container_id, port=port, ready=False,
+                            health_path=health_path
+                        )
+                    
+                    self.state.record_timing("time_to_ready", ready_after * 1000, True)
+                    cache_line = (
+                        f"⚡ Caché: {cache_size_mb} MB en memoria, TTL {cache_ttl} s\n" if cache else ""
+                    )
+                    tls_line = (
+                        f"🔒 HTTPS (HTTP/2): https://localhost:{tls_port}\n"
+                        f"📜 CA local: {ca_cert} (impórtala para confiar en el certificado)\n"
+                        if tls else ""
+                    )
+                    return self._reply(
+                        args, "deploy_server", True,
+                        (
                             f"🚀 Servidor web desplegado exitosamente!\n\n"
                             f"🆔 Container ID: {container_id}\n"
                             f"🔌 Puerto: {port}\n"
                             f"🌐 URL: http://localhost:{port}\n"
                             f"📁 Directorio: {www_abs}\n"
-                            f"🐳 Imagen: nginx:alpine\n\n"
+                            f"🐳 Imagen: {self._image_ref}\n"
+                            f"⏱️ Listo en: {ready_after * 1000:.0f} ms\n"
+                            f"{cache_line}"
+                            f"{tls_line}\n"
                             f"💡 Abre tu navegador en http://localhost:{port}\n"
                             f"📝 Los archivos en www/ se sirven automáticamente"
-                        )
+                        ),
+                        site=site.name, container=container, container_id=container_id, port=port, ready=True,
+                        url=f"http://localhost:{port}", image=self._image_ref,
+                        ready_ms=round(ready_after * 1000),
+                        cache={"size_mb": cache_size_mb, "ttl": cache_ttl} if cache else None,
+                        tls={"port": tls_port, "ca": str(ca_cert)} if tls else None
                     )
-                ]
-            else:
-                error_msg = stderr.decode()
-                return [
-                    TextContent(
-                        type="text",
-                        text=(
+                else:
+                    # El contenedor anterior ya se eliminó: nada queda sirviendo
+                    self.ports.release(container)
+                    self.ports.release(tls_owner)
+                    self.state.record_stop(container)
+                    error_msg = run.stderr
+                    return self._reply(
+                        args, "deploy_server", False,
+                        (
                             f"❌ Error al desplegar servidor\n\n"
                             f"Detalles: {error_msg}\n\n"
                             f"💡 Verifica que Docker Desktop esté corriendo"
-                        )
+                        ),
+                        error=error_msg
                     )
-                ]
-                
-        except Exception as e:
-            return [
-                TextContent(
-                    type="text",
-                    text=f"❌ Excepción al desplegar: {str(e)}"
+                    
+            except Exception as e:
+                self.ports.release(container)
+                self.ports.release(tls_owner)
+                self.state.record_stop(container)
+                site.cache_port = None
+                return self._reply(
+                    args, "deploy_server", False,
+                    f"❌ Excepción al desplegar: {str(e)}",
+                    error=str(e)
                 )
-            ]
     
     async def _stop_server(self, args: dict = None) -> list[TextContent]:
         """
@@ -383,44 +2523,44 @@ class WebDeployerServer:
         Returns:
             Lista con TextContent del resultado
         """
-        try:
-            # Comando combinado: detener Y eliminar
-            cmd = f'docker stop {CONTAINER_NAME} && docker rm {CONTAINER_NAME}'
-            
-            proc = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await proc.communicate()
-            
-            if proc.returncode == 0:
-                return [
-                    TextContent(
-                        type="text",
-                        text=(
+        site = self._site()
+        container = site.container
+        async with self._lock(container):
+            try:
+                # Detener y, solo si se detuvo, eliminar
+                result = await self.executor.run(["docker", "stop", container])
+                if result.ok:
+                    result = await self.executor.run(["docker", "rm", container])
+                
+                # Sin contenedor en marcha (detenido, sin eliminar o
+                # inexistente) el puerto queda libre, también en el almacén
+                self.ports.release(container)
+                self.ports.release(f"{container}:tls")
+                site.cache_port = None
+                self.state.record_stop(container)
+                if result.ok:
+                    return self._reply(
+                        args, "stop_server", True,
+                        (
                             f"🛑 Servidor web detenido y eliminado\n\n"
-                            f"✅ Contenedor '{CONTAINER_NAME}' removido\n"
+                            f"✅ Contenedor '{container}' removido\n"
                             f"📁 Los archivos en www/ se mantienen intactos"
-                        )
+                        ),
+                        site=site.name, container=container, stopped=True
                     )
-                ]
-            else:
-                return [
-                    TextContent(
-                        type="text",
-                        text=f"⚠️ No se encontró servidor web activo"
+                else:
+                    return self._reply(
+                        args, "stop_server", True,
+                        f"⚠️ No se encontró servidor web activo",
+                        site=site.name, container=container, stopped=False
                     )
-                ]
-                
-        except Exception as e:
-            return [
-                TextContent(
-                    type="text",
-                    text=f"❌ Error al detener servidor: {str(e)}"
+                    
+            except Exception as e:
+                return self._reply(
+                    args, "stop_server", False,
+                    f"❌ Error al detener servidor: {str(e)}",
+                    error=str(e)
                 )
-            ]
     
     async def _server_status(self, args: dict = None) -> list[TextContent]:
         """
@@ -432,22 +2572,18 @@ class WebDeployerServer:
         Returns:
             Lista con TextContent del estado actual
         """
+        site = self._site()
         try:
             # Obtener información del contenedor
+            # --filter con ^...$ para no confundirlo con otros contenedores
             # --format: salida personalizada con placeholders
-            cmd = (
-                f'docker ps --filter name={CONTAINER_NAME} '
-                f'--format "{{{{.ID}}}}|{{{{.Status}}}}|{{{{.Ports}}}}"'
-            )
-            
-            proc = await asyncio.create_subprocess_shell(
-                cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await proc.communicate()
-            output = stdout.decode().strip()
+            # Consultas simultáneas del mismo contenedor comparten un solo 'docker ps'
+            ps = await self._flights.do(("docker ps", site.container), lambda: self.executor.run([
+                "docker", "ps",
+                "--filter", f"name=^{site.container}$",
+                "--format", "{{.ID}}|{{.Status}}|{{.Ports}}",
+            ]))
+            output = ps.stdout
             
             if output:
                 # Parsear salida
@@ -455,38 +2591,50 @@ class WebDeployerServer:
                 container_id = parts[0][:12]
                 status = parts[1] if len(parts) > 1 else "Unknown"
                 ports = parts[2] if len(parts) > 2 else "Unknown"
+                port = parse_host_port(ports, 80) or DEFAULT_PORT
                 
-                return [
-                    TextContent(
-                        type="text",
-                        text=(
-                            f"✅ Servidor web ACTIVO\n\n"
-                            f"🆔 Container: {container_id}\n"
-                            f"📊 Estado: {status}\n"
-                            f"🔌 Puertos: {ports}\n"
-                            f"🌐 Acceso: http://localhost:{DEFAULT_PORT}\n\n"
-                            f"💡 El servidor está sirviendo archivos de www/"
-                        )
-                    )
-                ]
+                # Completar con lo registrado en el almacén de estado
+                record = next(
+                    (c for c in await self.state.containers() if c["name"] == site.container),
+                    None
+                )
+                deployed = f"🕐 Desplegado: {record['created_at']}\n" if record else ""
+                
+                return self._reply(
+                    args, "server_status", True,
+                    (
+                        f"✅ Servidor web ACTIVO\n\n"
+                        f"🆔 Container: {container_id}\n"
+                        f"📊 Estado: {status}\n"
+                        f"🔌 Puertos: {ports}\n"
+                        f"🌐 Acceso: http://localhost:{port}\n"
+                        f"{deployed}"
+                        f"🐳 Imagen: {self._image_ref} ({self.image_state})\n\n"
+                        f"💡 El servidor está sirviendo archivos de www/"
+                    ),
+                    site=site.name, running=True, container=site.container, container_id=container_id,
+                    status=status, port=port, url=f"http://localhost:{port}",
+                    deployed_at=record["created_at"] if record else None,
+                    image={"ref": self._image_ref, "state": self.image_state}
+                )
             else:
-                return [
-                    TextContent(
-                        type="text",
-                        text=(
-                            f"⭕ Servidor web INACTIVO\n\n"
-                            f"💡 Usa 'deploy_server' para iniciarlo"
-                        )
-                    )
-                ]
+                return self._reply(
+                    args, "server_status", True,
+                    (
+                        f"⭕ Servidor web INACTIVO\n\n"
+                        f"🐳 Imagen: {self._image_ref} ({self.image_state})\n"
+                        f"💡 Usa 'deploy_server' para iniciarlo"
+                    ),
+                    site=site.name, running=False, container=site.container,
+                    image={"ref": self._image_ref, "state": self.image_state}
+                )
                 
         except Exception as e:
-            return [
-                TextContent(
-                    type="text",
-                    text=f"❌ Error verificando estado: {str(e)}"
-                )
-            ]
+            return self._reply(
+                args, "server_status", False,
+                f"❌ Error verificando estado: {str(e)}",
+                error=str(e)
+            )
     
     async def _list_html_files(self, args: dict = None) -> list[TextContent]:
         """
@@ -501,19 +2649,22 @@ class WebDeployerServer:
             Lista con TextContent de los archivos encontrados
         """
         try:
-            # Obtener todos los archivos .html
-            html_files = list(WWW_DIR.glob("*.html"))
+            # Obtener todos los archivos .html del sitio
+            site = self._site()
+            html_files = list(site.www_dir.glob("*.html"))
             
             if not html_files:
-                return [
-                    TextContent(
-                        type="text",
-                        text=(
-                            f"📂 Directorio www/ está vacío\n\n"
-                            f"💡 Usa 'create_html' para crear archivos"
-                        )
-                    )
-                ]
+                return self._reply(
+                    args, "list_html_files", True,
+                    (
+                        f"📂 Directorio www/ está vacío\n\n"
+                        f"💡 Usa 'create_html' para crear archivos"
+                    ),
+                    chunk=0, chunks=1, total=0, files=[]
+                )
+            
+            if self._wants_json(args):
+                return self._list_html_chunks(html_files)
             
             # Construir lista de archivos con metadata
             file_list = []
@@ -528,53 +2679,439 @@ class WebDeployerServer:
             
             files_text = "\n\n".join(file_list)
             
-            return [
-                TextContent(
-                    type="text",
-                    text=(
-                        f"📂 Archivos HTML en www/ ({len(html_files)} encontrados)\n\n"
-                        f"{files_text}\n\n"
-                        f"🌐 Accesibles en: http://localhost:{DEFAULT_PORT}/FILENAME"
-                    )
+            return self._reply(
+                args, "list_html_files", True,
+                (
+                    f"📂 Archivos HTML en www/ ({len(html_files)} encontrados)\n\n"
+                    f"{files_text}\n\n"
+                    f"🌐 Accesibles en: http://localhost:{self.ports.port_of(site.container) or DEFAULT_PORT}/FILENAME"
                 )
-            ]
+            )
             
         except Exception as e:
-            return [
-                TextContent(
-                    type="text",
-                    text=f"❌ Error listando archivos: {str(e)}"
+            return self._reply(
+                args, "list_html_files", False,
+                f"❌ Error listando archivos: {str(e)}",
+                error=str(e)
+            )
+    
+    async def _purge_paths(self, port: int, paths: list[str]) -> dict[str, bool]:
+        """
+        Refresca rutas en la caché del servidor desplegado.
+        
+        Cada ruta se pide con la cabecera 'X-MCP-Purge', que salta la caché
+        y guarda la respuesta nueva del origen. Las rutas se purgan en
+        paralelo.
+        
+        Args:
+            port: Puerto del servidor con la caché activa
+            paths: Rutas HTTP a purgar
+        
+        Returns:
+            Diccionario ruta -> True si la caché se refrescó
+        """
+        statuses = await asyncio.gather(*(
+            http_status(port, path, headers={"X-MCP-Purge": "1"})
+            for path in paths
+        ))
+        return {
+            path: status is not None and status < 500
+            for path, status in zip(paths, statuses)
+        }
+    
+    async def _purge_cache(self, args: dict = None) -> list[TextContent]:
+        """
+        Purga rutas de la caché HTTP del servidor web.
+        
+        Args:
+            args: Diccionario con 'paths' opcional (default: ["/"])
+        
+        Returns:
+            Lista con TextContent del resultado por ruta
+        """
+        paths = (args or {}).get("paths") or ["/"]
+        site = self._site()
+        
+        if site.cache_port is None:
+            return self._reply(
+                args, "purge_cache", False,
+                (
+                    f"⭕ La caché no está activa\n\n"
+                    f"💡 Despliega con 'deploy_server' y cache=true para usarla"
+                ),
+                error="cache not active"
+            )
+        
+        invalid = [path for path in paths if not re.match(HEALTH_PATH_PATTERN, path)]
+        if invalid:
+            return self._reply(
+                args, "purge_cache", False,
+                f"❌ Rutas inválidas: {', '.join(invalid)}",
+                error="invalid paths", paths=invalid
+            )
+        
+        try:
+            purged = await self._purge_paths(site.cache_port, paths)
+            lines = "\n".join(
+                f"{'✅' if ok else '❌'} {path}" for path, ok in purged.items()
+            )
+            return self._reply(
+                args, "purge_cache", True,
+                f"♻️ Purga de caché ({len(purged)} rutas)\n\n{lines}",
+                purged=purged
+            )
+        except Exception as e:
+            return self._reply(
+                args, "purge_cache", False,
+                f"❌ Error purgando caché: {str(e)}",
+                error=str(e)
+            )
+    
+    async def _ingest_access_log(self, site: Site) -> int:
+        """
+        Lee las líneas nuevas del access log (fuera del event loop) y las agrega.
+        
+        Args:
+            site: Sitio cuyo access log se lee
+        
+        Lecturas simultáneas del mismo sitio se agrupan en una sola: así
+        dos llamadas a la vez no leen el mismo tramo del log dos veces.
+        
+        Returns:
+            Número de peticiones agregadas
+        """
+        async def ingest():
+            loop = asyncio.get_running_loop()
+            lines = await loop.run_in_executor(None, site.access_log.read_new)
+            if site.access_log.needs_rotation():
+                await self._rotate_access_log(site)
+            return site.traffic.ingest(lines)
+        
+        return await self._flights.do(("access log", site.name), ingest)
+    
+    async def _rotate_access_log(self, site: Site) -> bool:
+        """
+        Rota el access log de un sitio con nginx.
+        
+        El log pertenece a root dentro del contenedor, así que se renombra
+        desde el propio contenedor y se pide a nginx que reabra sus logs
+        (señal USR1). La señal solo se envía: los workers siguen
+        escribiendo en el archivo rotado (.1) hasta reabrir, así que el
+        tailer lo sigue leyendo en los próximos sondeos hasta que aparece
+        el log nuevo (AccessLogTailer.follow_rotated). Mientras tanto no se
+        vuelve a rotar, de modo que .1 no se sobrescribe sin haberse leído.
+        
+        Args:
+            site: Sitio cuyo log se rota
+        
+        Returns:
+            True si el log se rotó
+        """
+        # Sin contenedor activo el log no crece: no hay nada que rotar
+        if self.ports.port_of(site.container) is None:
+            return False
+        current = f"{ACCESS_LOG_DIR}/{ACCESS_LOG_NAME}"
+        moved = await self.executor.run(
+            ["docker", "exec", site.container, "mv", "-f", current, f"{current}.1"]
+        )
+        if not moved.ok:
+            return False
+        site.access_log.follow_rotated(site.access_log.path.with_name(f"{ACCESS_LOG_NAME}.1"))
+        await self.executor.run(["docker", "kill", "-s", "USR1", site.container])
+        return True
+    
+    async def _tail_access_logs(self):
+        """Sigue los access logs de todos los sitios mientras el servidor corre."""
+        while True:
+            for site in list(self.sites.values()):
+                try:
+                    await self._ingest_access_log(site)
+                except Exception as e:
+                    print(f"⚠️ Error leyendo access log de {site.name}: {e}", file=sys.stderr)
+            await asyncio.sleep(TRAFFIC_POLL)
+    
+    async def _site_traffic(self, args: dict = None) -> list[TextContent]:
+        """
+        Resume el tráfico reciente del sitio desplegado.
+        
+        Muestra:
+        - Peticiones y bytes servidos
+        - Códigos de estado
+        - Rutas más visitadas (count-min sketch)
+        - Percentiles de latencia total y del upstream (con caché)
+        
+        Args:
+            args: Diccionario con 'window_minutes' y 'top' opcionales
+        
+        Returns:
+            Lista con TextContent del resumen
+        """
+        args = args or {}
+        minutes = int(args.get("window_minutes", 15))
+        top = int(args.get("top", 10))
+        
+        site = self._site()
+        try:
+            await self._ingest_access_log(site)
+            summary = site.traffic.summary(minutes, top)
+            
+            if summary["requests"] == 0:
+                return self._reply(
+                    args, "site_traffic", True,
+                    (
+                        f"📈 Sin tráfico en los últimos {minutes} minutos\n\n"
+                        f"💡 Visita el sitio desplegado para generar datos"
+                    ),
+                    site=site.name, window_minutes=minutes, requests=0
                 )
-            ]
+            
+            def ms(percentiles: dict) -> str:
+                if not percentiles:
+                    return "n/a"
+                return " / ".join(f"p{int(q * 100)} {v * 1000:.0f} ms" for q, v in percentiles.items())
+            
+            statuses = ", ".join(f"{code}: {count}" for code, count in summary["status"].items())
+            paths = "\n".join(
+                f"   {i}. {path} (~{count})"
+                for i, (path, count) in enumerate(summary["top_paths"], 1)
+            )
+            def ms_map(percentiles: dict) -> dict:
+                return {f"p{int(q * 100)}": round(v * 1000, 1) for q, v in percentiles.items()}
+            
+            return self._reply(
+                args, "site_traffic", True,
+                (
+                    f"📈 Tráfico de los últimos {minutes} minutos\n\n"
+                    f"📨 Peticiones: {summary['requests']}\n"
+                    f"📦 Bytes servidos: {summary['bytes']}\n"
+                    f"🔢 Estados: {statuses}\n"
+                    f"⏱️ Latencia: {ms(summary['latency'])}\n"
+                    f"🔁 Latencia upstream: {ms(summary['upstream_latency'])}\n\n"
+                    f"🔥 Rutas más visitadas:\n{paths}"
+                ),
+                site=site.name,
+                window_minutes=minutes,
+                requests=summary["requests"],
+                bytes=summary["bytes"],
+                status=summary["status"],
+                top_paths=[{"path": path, "count": count} for path, count in summary["top_paths"]],
+                latency_ms=ms_map(summary["latency"]),
+                upstream_latency_ms=ms_map(summary["upstream_latency"])
+            )
+        except Exception as e:
+            return self._reply(
+                args, "site_traffic", False,
+                f"❌ Error analizando tráfico: {str(e)}",
+                error=str(e)
+            )
     
-    async def run(self):
+    def _start_background(self):
         """
-        Inicia el servidor MCP.
+        Lanza la inicialización diferida y los trabajos de fondo.
+        
+        - Directorios del proyecto (www/, examples/)
+        - Pre-calentamiento de la imagen Docker
+        - Reconciliación del estado guardado con Docker
+        - Seguimiento de los access logs
+        """
+        loop = asyncio.get_running_loop()
+        self._background = [
+            asyncio.ensure_future(loop.run_in_executor(None, self._ensure_directories)),
+            self._start_image_prewarm(),
+            asyncio.create_task(self._reconcile_state()),
+            asyncio.create_task(self._tail_access_logs()),
+        ]
+    
+    async def _serve_stdio(self, handshake: Optional[tuple] = None):
+        """
+        Sirve MCP por stdio respondiendo al handshake sin esperar al SDK.
         
-        Configura la comunicación stdio (stdin/stdout) que es el mecanismo
-        que usa Claude Desktop para comunicarse con servidores MCP.
+        Proceso:
+        1. Importa el SDK y registra las herramientas en un hilo
+        2. Mientras tanto lee el primer mensaje; si es 'initialize' lo
+           responde al momento (read_handshake). Si se arrancó con
+           src/launcher.py ya viene leído y respondido en 'handshake'
+        3. Lanza los trabajos de fondo
+        4. Con el SDK cargado, le entrega ese primer mensaje (para que
+           registre la sesión) seguido del resto de stdin, descartando
+           su respuesta duplicada al handshake
         
-        El servidor queda corriendo indefinidamente esperando comandos.
+        Args:
+            handshake: Tupla (primera línea, id respondido) de read_handshake
         """
-        async with stdio_server() as (read_stream, write_stream):
+        loop = asyncio.get_running_loop()
+        sdk_ready = loop.run_in_executor(None, lambda: self.server)
+        if handshake is None:
+            handshake = await loop.run_in_executor(
+                None, read_handshake, sys.stdin.buffer, sys.stdout.buffer
+            )
+        first, handshake_id = handshake
+        if not first:
+            return
+        
+        self._start_background()
+        await sdk_ready
+        
+        import anyio
+        from io import TextIOWrapper
+        from mcp.server.stdio import stdio_server
+        stdin = ReplayedStdin(
+            [first.decode("utf-8", errors="replace")],
+            anyio.wrap_file(TextIOWrapper(sys.stdin.buffer, encoding="utf-8", errors="replace"))
+        )
+        stdout = HandshakeStdout(
+            anyio.wrap_file(TextIOWrapper(sys.stdout.buffer, encoding="utf-8")),
+            handshake_id
+        )
+        async with stdio_server(stdin, stdout) as (read_stream, write_stream):
             await self.server.run(
                 read_stream,
                 write_stream,
                 self.server.create_initialization_options()
             )
+    
+    async def _serve_http(self, host: str, port: int):
+        """
+        Sirve MCP por HTTP a muchos clientes desde este mismo proceso.
+        
+        Expone dos transportes sobre el mismo servidor MCP:
+        - Streamable HTTP en /mcp (clientes actuales)
+        - SSE en /sse, con los mensajes del cliente en /messages/
+        
+        Todas las sesiones comparten Docker, la imagen pre-calentada, las
+        reservas de puertos y el almacén de estado; cada sesión trabaja
+        sobre su propio sitio (ver _site).
+        
+        Args:
+            host: Dirección de escucha
+            port: Puerto de escucha
+        
+        Raises:
+            RuntimeError: Si no están instalados uvicorn y starlette
+        """
+        try:
+            import uvicorn
+            from starlette.applications import Starlette
+            from starlette.responses import Response
+            from starlette.routing import Mount, Route
+            from mcp.server.sse import SseServerTransport
+            from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+        except ImportError as e:
+            raise RuntimeError(
+                "El modo http requiere 'uvicorn' y 'starlette' (pip install uvicorn starlette)"
+            ) from e
+        
+        deployer = self
+        
+        class SessionApp:
+            # El gestor de streamable HTTP solo usa run() y
+            # create_initialization_options(): cada sesión pasa por
+            # _run_session para liberar su sitio anónimo al terminar
+            def create_initialization_options(self):
+                return deployer.server.create_initialization_options()
+            
+            async def run(self, *args, **kwargs):
+                await deployer._run_session(*args, **kwargs)
+        
+        security = http_security_settings(host, port)
+        sessions = StreamableHTTPSessionManager(app=SessionApp(), security_settings=security)
+        sse = SseServerTransport("/messages/", security_settings=security)
+        
+        class StreamableHttpEndpoint:
+            # Una instancia (no una función) hace que Starlette la trate
+            # como aplicación ASGI en lugar de como endpoint request/response
+            async def __call__(self, scope, receive, send):
+                await sessions.handle_request(scope, receive, send)
+        
+        async def handle_sse(request):
+            async with sse.connect_sse(request.scope, request.receive, request._send) as streams:
+                await self._run_session(
+                    streams[0],
+                    streams[1],
+                    self.server.create_initialization_options()
+                )
+            return Response()
+        
+        app = Starlette(routes=[
+            Route("/mcp", endpoint=StreamableHttpEndpoint()),
+            Route("/sse", endpoint=handle_sse, methods=["GET"]),
+            Mount("/messages/", app=sse.handle_post_message),
+        ])
+        config = uvicorn.Config(app, host=host, port=port, log_level="warning")
+        async with sessions.run():
+            await uvicorn.Server(config).serve()
+    
+    async def run(self, transport: str = TRANSPORT, host: str = HTTP_HOST, port: int = HTTP_PORT,
+                  handshake: Optional[tuple] = None):
+        """
+        Inicia el servidor MCP.
+        
+        Con transport="stdio" se comunica por stdin/stdout, que es el
+        mecanismo que usa Claude Desktop (un proceso por cliente). Con
+        transport="http" un solo proceso atiende a muchos clientes por
+        streamable HTTP/SSE, con un sitio aislado por sesión.
+        
+        El servidor queda corriendo indefinidamente esperando comandos.
+        Mientras tanto, en segundo plano, se pre-calienta la imagen Docker,
+        se reconcilia el estado guardado con los contenedores reales y se
+        siguen los access logs de los sitios.
+        
+        Args:
+            transport: "stdio" o "http"
+            host: Dirección de escucha del modo http
+            port: Puerto de escucha del modo http
+            handshake: Handshake stdio ya respondido por src/launcher.py
+        """
+        self.transport = transport
+        try:
+            if transport == "http":
+                self._start_background()
+                await self._serve_http(host, port)
+            else:
+                await self._serve_stdio(handshake)
+        finally:
+            for task in self._background:
+                task.cancel()
+            await self.state.flush()
+            self.state.close()
 
 
-async def main():
+async def main(handshake: Optional[tuple] = None):
     """
     Función principal de entrada del programa.
     
-    Instancia y ejecuta el servidor MCP.
+    Instancia y ejecuta el servidor MCP con el transporte elegido
+    (argumentos de línea de comandos o variables MCP_WEB_TRANSPORT,
+    MCP_WEB_HTTP_HOST y MCP_WEB_HTTP_PORT).
+    
+    Args:
+        handshake: Handshake stdio ya respondido por src/launcher.py
     """
+    import argparse
+    import importlib.util
+    if sys.version_info < (3, 10):
+        print("Error: se requiere Python 3.10 o superior (lo exige el SDK de MCP)")
+        sys.exit(1)
+    if importlib.util.find_spec("mcp") is None:
+        print("Error: MCP SDK no instalado. Ejecuta: pip install mcp")
+        sys.exit(1)
+    
+    parser = argparse.ArgumentParser(description="MCP Web Deployer Server")
+    parser.add_argument("--transport", choices=["stdio", "http"], default=TRANSPORT)
+    parser.add_argument("--host", default=HTTP_HOST)
+    parser.add_argument("--port", type=int, default=HTTP_PORT)
+    options = parser.parse_args()
+    
     print("🚀 Iniciando MCP Web Deployer Server...", file=sys.stderr)
     print(f"📁 Directorio www: {WWW_DIR}", file=sys.stderr)
+    if options.transport == "http":
+        print(
+            f"🌐 Escuchando en http://{options.host}:{options.port}/mcp (SSE en /sse)",
+            file=sys.stderr
+        )
     
     server = WebDeployerServer()
-    await server.run()
+    await server.run(options.transport, options.host, options.port, handshake)
 
 
 if __name__ == "__main__":
@@ -19,7 +19,12 @@ import pytest
 import sys
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src.server import WebDeployerServer, WWW_DIR, EXAMPLES_DIR, CONTAINER_NAME
+from src.server import (
+    WebDeployerServer, StateStore, PortAllocator, PortUnavailableError,
+    CommandExecutor, WWW_DIR, EXAMPLES_DIR, CONTAINER_NAME, PROTOCOL_VERSIONS,
+    docker_volume_path, parse_host_port, wait_until_ready
+)
+from mcp.shared.version import SUPPORTED_PROTOCOL_VERSIONS
 
 
 # ============================================================
@@ -27,9 +32,23 @@ from src.server import WebDeployerServer, WWW_DIR, EXAMPLES_DIR, CONTAINER_NAME
 # ============================================================
 
 @pytest.fixture
-def server():
-    """Crea una instancia del servidor para cada test."""
-    return WebDeployerServer()
+def server(tmp_path, monkeypatch):
+    """Crea una instancia del servidor para cada test (estado y logs en tmp)."""
+    import src.server as srv
+    monkeypatch.setattr(srv, "STATE_DB", tmp_path / "state" / "deployer.db")
+    monkeypatch.setattr(srv, "RUNTIME_DIR", tmp_path / "runtime")
+    monkeypatch.setattr(srv, "LOGS_DIR", tmp_path / "logs")
+    monkeypatch.setattr(srv, "CERTS_DIR", tmp_path / "certs")
+    instance = WebDeployerServer()
+    yield instance
+    instance.state.close()
+
+
+@pytest.fixture(autouse=True)
+def instant_readiness(monkeypatch):
+    """Docker esta mockeado, asi que ningun nginx real va a responder."""
+    import src.server as srv
+    monkeypatch.setattr(srv, "wait_until_ready", AsyncMock(return_value=0.05))
 
 
 @pytest.fixture
@@ -59,21 +78,156 @@ class TestServerInit:
         assert server.server.name == "web-deployer"
 
     def test_www_directory_exists(self, server):
-        """El directorio www/ existe tras inicializar."""
+        """El directorio www/ existe tras la inicializacion diferida."""
+        server._ensure_directories()
         assert WWW_DIR.exists()
         assert WWW_DIR.is_dir()
 
     def test_examples_directory_exists(self, server):
-        """El directorio examples/ existe tras inicializar."""
+        """El directorio examples/ existe tras la inicializacion diferida."""
+        server._ensure_directories()
         assert EXAMPLES_DIR.exists()
         assert EXAMPLES_DIR.is_dir()
 
     def test_gitkeep_exists(self, server):
         """El archivo .gitkeep existe en www/."""
+        server._ensure_directories()
         gitkeep = WWW_DIR / ".gitkeep"
         assert gitkeep.exists()
 
 
+# ============================================================
+# Tests de arranque rapido
+# ============================================================
+
+class TestFastStartup:
+    """Tests del handshake sin SDK y de la carga diferida."""
+
+    def test_module_import_skips_sdk(self):
+        """Importar el modulo no carga el SDK de MCP."""
+        import subprocess
+        code = "import sys; import src.server; print('mcp' in sys.modules)"
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=Path(__file__).parent.parent,
+            capture_output=True, text=True, check=True
+        )
+        assert out.stdout.strip() == "False"
+
+    def test_protocol_versions_match_sdk(self):
+        """El handshake rapido acepta exactamente las versiones del SDK instalado."""
+        assert PROTOCOL_VERSIONS == tuple(SUPPORTED_PROTOCOL_VERSIONS)
+
+    @pytest.mark.parametrize(
+        "version", sorted({*SUPPORTED_PROTOCOL_VERSIONS, *PROTOCOL_VERSIONS, "1999-01-01"})
+    )
+    def test_initialize_result_matches_sdk(self, server, version):
+        """La respuesta rapida a 'initialize' es la misma que la del SDK."""
+        import src.server as srv
+        from mcp.types import LATEST_PROTOCOL_VERSION
+        options = server.server.create_initialization_options()
+        result = srv.initialize_result({"protocolVersion": version})
+
+        expected = version if version in SUPPORTED_PROTOCOL_VERSIONS else LATEST_PROTOCOL_VERSION
+        assert result["protocolVersion"] == expected
+        assert result["capabilities"] == options.capabilities.model_dump(by_alias=True, exclude_none=True)
+        assert result["serverInfo"] == {"name": options.server_name, "version": options.server_version}
+
+    @pytest.mark.asyncio
+    async def test_handshake_stdout_drops_duplicate(self):
+        """Solo se descarta la respuesta del SDK al handshake ya respondido."""
+        import src.server as srv
+        written = []
+
+        class Sink:
+            async def write(self, data):
+                written.append(data)
+
+            async def flush(self):
+                pass
+
+        stdout = srv.HandshakeStdout(Sink(), 1)
+        await stdout.write('{"jsonrpc":"2.0","id":1,"result":{}}\n')
+        await stdout.write('{"jsonrpc":"2.0","id":1,"result":{"again":true}}\n')
+        assert written == ['{"jsonrpc":"2.0","id":1,"result":{"again":true}}\n']
+
+    @pytest.mark.asyncio
+    async def test_replayed_stdin(self):
+        """El primer mensaje leido se entrega antes que el resto de stdin."""
+        import src.server as srv
+
+        async def rest():
+            yield "b\n"
+
+        lines = [line async for line in srv.ReplayedStdin(["a\n"], rest())]
+        assert lines == ["a\n", "b\n"]
+
+    def test_launcher_import_is_light(self):
+        """El punto de entrada no carga asyncio, sqlite3 ni el servidor completo."""
+        import subprocess
+        code = (
+            "import sys; import src.launcher; "
+            "print(sorted(m for m in ('asyncio', 'sqlite3', 'src.server', 'mcp') if m in sys.modules))"
+        )
+        out = subprocess.run(
+            [sys.executable, "-c", code], cwd=Path(__file__).parent.parent,
+            capture_output=True, text=True, check=True
+        )
+        assert out.stdout.strip() == "[]"
+
+    def test_read_handshake_answers_initialize(self):
+        """read_handshake responde 'initialize' y devuelve la línea para el SDK."""
+        import io
+        import json
+        from src.launcher import read_handshake, initialize_result
+        line = b'{"jsonrpc":"2.0","id":7,"method":"initialize","params":{"protocolVersion":"2025-06-18"}}\n'
+        out = io.BytesIO()
+        assert read_handshake(io.BytesIO(line), out) == (line, 7)
+        response = json.loads(out.getvalue())
+        assert response["id"] == 7
+        assert response["result"] == initialize_result({"protocolVersion": "2025-06-18"})
+
+    def test_read_handshake_passes_other_messages(self):
+        """Otro primer mensaje (o stdin vacío) se deja para el SDK sin responder."""
+        import io
+        from src.launcher import read_handshake
+        out = io.BytesIO()
+        ping = b'{"jsonrpc":"2.0","id":1,"method":"ping"}\n'
+        assert read_handshake(io.BytesIO(ping), out) == (ping, None)
+        assert read_handshake(io.BytesIO(b"no json\n"), out) == (b"no json\n", None)
+        assert read_handshake(io.BytesIO(b""), out) == (b"", None)
+        assert out.getvalue() == b""
+
+    def test_launcher_hands_session_to_sdk(self, tmp_path):
+        """Tras el handshake del launcher, el SDK atiende la sesión (tools/list)."""
+        import json
+        import subprocess
+        root = Path(__file__).parent.parent
+        messages = [
+            {"jsonrpc": "2.0", "id": 1, "method": "initialize",
+             "params": {"protocolVersion": "2025-06-18", "capabilities": {},
+                        "clientInfo": {"name": "test", "version": "1"}}},
+            {"jsonrpc": "2.0", "method": "notifications/initialized"},
+            {"jsonrpc": "2.0", "id": 2, "method": "tools/list"},
+        ]
+        proc = subprocess.Popen(
+            [sys.executable, str(root / "src" / "launcher.py")],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            env=dict(os.environ, MCP_WEB_STATE_DB=str(tmp_path / "state.db")),
+        )
+        try:
+            for message in messages:
+                proc.stdin.write((json.dumps(message) + "\n").encode())
+            proc.stdin.flush()
+            responses = [json.loads(proc.stdout.readline()) for _ in range(2)]
+        finally:
+            proc.stdin.close()
+            proc.wait(timeout=10)
+
+        assert [r["id"] for r in responses] == [1, 2]
+        tools = {tool["name"] for tool in responses[1]["result"]["tools"]}
+        assert {"create_html", "deploy_server", "stop_server"} <= tools
+
+
 # ============================================================
 # Tests de create_html
 # ============================================================
@@ -204,7 +358,8 @@ class TestDeployServer:
         )
         mock_proc.returncode = 0
 
-        with patch("asyncio.create_subprocess_shell", return_value=mock_proc):
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
             result = await server._deploy_server({"port": 8080})
 
         text = result[0].text
@@ -221,7 +376,8 @@ class TestDeployServer:
         )
         mock_proc.returncode = 0
 
-        with patch("asyncio.create_subprocess_shell", return_value=mock_proc):
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
             result = await server._deploy_server({"port": 9090})
 
         assert "http://localhost:9090" in result[0].text
@@ -235,7 +391,8 @@ class TestDeployServer:
         )
         mock_proc.returncode = 1
 
-        with patch("asyncio.create_subprocess_shell", return_value=mock_proc):
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
             result = await server._deploy_server({"port": 8080})
 
         assert "Error" in result[0].text
@@ -249,7 +406,8 @@ class TestDeployServer:
         )
         mock_proc.returncode = 0
 
-        with patch("asyncio.create_subprocess_shell", return_value=mock_proc):
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
             result = await server._deploy_server({})
 
         assert "8080" in result[0].text
@@ -269,7 +427,7 @@ class TestStopServer:
         mock_proc.communicate = AsyncMock(return_value=(b"", b""))
         mock_proc.returncode = 0
 
-        with patch("asyncio.create_subprocess_shell", return_value=mock_proc):
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
             result = await server._stop_server({})
 
         text = result[0].text
@@ -285,7 +443,7 @@ class TestStopServer:
         )
         mock_proc.returncode = 1
 
-        with patch("asyncio.create_subprocess_shell", return_value=mock_proc):
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
             result = await server._stop_server({})
 
         assert "No se encontr" in result[0].text
@@ -307,7 +465,7 @@ class TestServerStatus:
         )
         mock_proc.returncode = 0
 
-        with patch("asyncio.create_subprocess_shell", return_value=mock_proc):
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
             result = await server._server_status({})
 
         text = result[0].text
@@ -322,12 +480,1202 @@ class TestServerStatus:
         mock_proc.communicate = AsyncMock(return_value=(b"", b""))
         mock_proc.returncode = 0
 
-        with patch("asyncio.create_subprocess_shell", return_value=mock_proc):
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
             result = await server._server_status({})
 
         assert "INACTIVO" in result[0].text
 
 
+# ============================================================
+# Tests de respuestas JSON compactas
+# ============================================================
+
+class TestCompactResponses:
+    """Tests del formato de respuesta 'json'."""
+
+    @pytest.mark.asyncio
+    async def test_create_html_json(self, server, temp_www):
+        """create_html devuelve JSON compacto con esquema estable."""
+        import json
+        result = await server._create_html(
+            {"filename": "a.html", "content": "<p>hola</p>", "format": "json"}
+        )
+        text = result[0].text
+        assert " " not in text.replace("<p>hola</p>", "")
+        data = json.loads(text)
+        assert data == {"ok": True, "tool": "create_html", "file": "a.html", "size": 11, "purged": []}
+
+    @pytest.mark.asyncio
+    async def test_error_json(self, server):
+        """Los errores usan {"ok": false, "error": ...}."""
+        import json
+        result = await server._deploy_server({"health_path": "/$(reboot)", "format": "json"})
+        data = json.loads(result[0].text)
+        assert data["ok"] is False
+        assert data["tool"] == "deploy_server"
+        assert "health_path" in data["error"]
+
+    @pytest.mark.asyncio
+    async def test_status_json(self, server):
+        """server_status expone los campos sin emojis."""
+        import json
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(
+            return_value=(b"abc123def456|Up 5 minutes|0.0.0.0:8080->80/tcp\n", b"")
+        )
+        mock_proc.returncode = 0
+
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            result = await server._server_status({"format": "json"})
+
+        data = json.loads(result[0].text)
+        assert data["running"] is True
+        assert data["container"] == CONTAINER_NAME
+        assert data["container_id"] == "abc123def456"
+        assert data["port"] == 8080
+
+    @pytest.mark.asyncio
+    async def test_container_fields_agree_across_tools(self, server):
+        """'container' es el nombre y 'container_id' el ID en todas las herramientas."""
+        import json
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            deploy = json.loads((await server._deploy_server({"port": 8080, "format": "json"}))[0].text)
+            stop = json.loads((await server._stop_server({"format": "json"}))[0].text)
+
+        assert deploy["container"] == stop["container"] == CONTAINER_NAME
+        assert deploy["container_id"] == "abc123def456"
+        assert "container_id" not in stop
+
+    @pytest.mark.asyncio
+    async def test_list_json_chunked(self, server, temp_www):
+        """Los listados grandes se devuelven en varios trozos."""
+        import json
+        import src.server as srv
+        for i in range(5):
+            (temp_www / f"p{i}.html").write_text("<html></html>")
+        with patch.object(srv, "LIST_CHUNK_SIZE", 2):
+            result = await server._list_html_files({"format": "json"})
+
+        chunks = [json.loads(item.text) for item in result]
+        assert [c["chunk"] for c in chunks] == [0, 1, 2]
+        assert all(c["chunks"] == 3 and c["total"] == 5 for c in chunks)
+        names = [f["name"] for c in chunks for f in c["files"]]
+        assert names == [f"p{i}.html" for i in range(5)]
+        assert chunks[0]["files"][0]["size"] == 13
+
+    @pytest.mark.asyncio
+    async def test_default_format_from_env(self, server, temp_www):
+        """MCP_WEB_RESPONSE_FORMAT cambia el formato por defecto."""
+        import json
+        import src.server as srv
+        with patch.object(srv, "RESPONSE_FORMAT", "json"):
+            as_json = await server._list_html_files({})
+            as_text = await server._list_html_files({"format": "text"})
+        assert json.loads(as_json[0].text)["total"] == 0
+        assert "vacío" in as_text[0].text
+
+
+# ============================================================
+# Tests del transporte HTTP (un proceso, muchas sesiones)
+# ============================================================
+
+class TestHttpTransport:
+    """Tests del modo http y del aislamiento de sitios por sesion."""
+
+    def test_site_names(self):
+        """Cada sitio tiene su contenedor y su directorio."""
+        import src.server as srv
+        assert srv.Site("default").container == CONTAINER_NAME
+        assert srv.Site("default").www_dir == srv.WWW_DIR
+        assert srv.Site("alpha").container == f"{CONTAINER_NAME}-alpha"
+        assert srv.Site("alpha").www_dir == srv.SITES_DIR / "alpha"
+        assert srv.Site.name_of(f"{CONTAINER_NAME}-alpha") == "alpha"
+        assert srv.Site.name_of(CONTAINER_NAME) == "default"
+        assert srv.Site.name_of("otro") is None
+
+    @pytest.mark.asyncio
+    async def test_stdio_uses_default_site(self, server, temp_www):
+        """Fuera del modo http todo va al sitio por defecto (www/)."""
+        await server._create_html({"filename": "a.html", "content": "x"})
+        assert (temp_www / "a.html").exists()
+
+    @pytest.mark.asyncio
+    async def test_sessions_get_isolated_sites(self, server, tmp_path, monkeypatch):
+        """Cada sesion HTTP tiene su sitio; el anonimo se libera al cerrar la sesion."""
+        import json
+        import socket
+        pytest.importorskip("uvicorn")
+        import src.server as srv
+        from mcp import ClientSession
+        from mcp.client.streamable_http import streamablehttp_client
+
+        monkeypatch.setattr(srv, "SITES_DIR", tmp_path / "sites")
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server.transport = "http"
+        task = asyncio.create_task(server._serve_http("127.0.0.1", port))
+        for _ in range(100):
+            if srv.port_is_free(port) is False:
+                break
+            await asyncio.sleep(0.05)
+
+        async def call(headers, *calls):
+            url = f"http://127.0.0.1:{port}/mcp"
+            async with streamablehttp_client(url, headers=headers) as (read, write, _):
+                async with ClientSession(read, write) as session:
+                    await session.initialize()
+                    results = []
+                    for tool, args in calls:
+                        result = await session.call_tool(tool, {**args, "format": "json"})
+                        results.append(json.loads(result.content[0].text))
+                    open_sites = sorted(p.name for p in (tmp_path / "sites").iterdir())
+                    return results, open_sites
+
+        create = ("create_html", {"filename": "index.html", "content": "<p>hola</p>"})
+        fake, commands = make_exec_mock(lambda cmd: (0, b"abc123def456789\n"))
+        try:
+            with patch("src.server.port_is_free", return_value=True), \
+                    patch("asyncio.create_subprocess_exec", side_effect=fake):
+                (named,), _ = await call({"X-MCP-Site": "alpha"}, create)
+                (anonymous, deployed), open_sites = await call(None, create, ("deploy_server", {}))
+                # Al cerrar la sesión anónima su sitio se libera
+                for _ in range(100):
+                    if deployed["site"] not in server.sites:
+                        break
+                    await asyncio.sleep(0.02)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        assert named["ok"] and anonymous["ok"] and deployed["ok"]
+        assert deployed["site"] != "alpha" and open_sites == sorted(["alpha", deployed["site"]])
+        assert (tmp_path / "sites" / "alpha" / "index.html").exists()
+        assert [p.name for p in (tmp_path / "sites").iterdir()] == ["alpha"]
+        assert set(server.sites) == {"default", "alpha"}
+        assert f"docker rm -f {deployed['container']}" in commands
+        assert server.ports.port_of(deployed["container"]) is None
+
+    def test_security_settings_allow_only_local_hosts(self):
+        """El modo http solo acepta Host/Origin de la dirección de escucha."""
+        import src.server as srv
+        settings = srv.http_security_settings("127.0.0.1", 8765)
+        assert settings.enable_dns_rebinding_protection
+        assert settings.allowed_hosts == ["127.0.0.1:8765", "localhost:8765"]
+        assert "http://localhost:8765" in settings.allowed_origins
+
+    @pytest.mark.asyncio
+    async def test_rejects_foreign_host_and_origin(self, server):
+        """Una página con otro dominio (DNS rebinding) no llega a las herramientas."""
+        import socket
+        pytest.importorskip("uvicorn")
+        import httpx
+        import src.server as srv
+
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server.transport = "http"
+        task = asyncio.create_task(server._serve_http("127.0.0.1", port))
+        for _ in range(100):
+            if srv.port_is_free(port) is False:
+                break
+            await asyncio.sleep(0.05)
+
+        body = {"jsonrpc": "2.0", "id": 1, "method": "tools/list"}
+        accept = {"Accept": "application/json, text/event-stream", "Content-Type": "application/json"}
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+                host = await client.post("/mcp", json=body, headers={**accept, "Host": f"evil.example:{port}"})
+                origin = await client.post("/mcp", json=body, headers={**accept, "Origin": "http://evil.example"})
+                sse = await client.post("/messages/?session_id=x", json=body, headers={"Host": "evil.example"})
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        assert host.status_code == 421
+        assert origin.status_code == 403
+        assert sse.status_code == 421
+
+
+# ============================================================
+# Tests de pre-calentamiento de imagen (con mock de Docker)
+# ============================================================
+
+def make_exec_mock(results):
+    """
+    Crea un mock de create_subprocess_exec que registra los comandos.
+
+    Args:
+        results: Funcion cmd -> (returncode, stdout) para cada comando,
+            con cmd como el argv unido por espacios
+    """
+    commands = []
+
+    async def fake_exec(*argv, **kwargs):
+        cmd = " ".join(argv)
+        commands.append(cmd)
+        returncode, stdout = results(cmd)
+        proc = AsyncMock()
+        proc.communicate = AsyncMock(return_value=(stdout, b""))
+        proc.returncode = returncode
+        return proc
+
+    return fake_exec, commands
+
+
+class TestImagePrewarm:
+    """Tests para la preparacion de la imagen Docker."""
+
+    @pytest.mark.asyncio
+    async def test_image_present_skips_pull(self, server):
+        """Si la imagen existe localmente no se descarga."""
+        fake, commands = make_exec_mock(lambda cmd: (0, b""))
+        with patch("asyncio.create_subprocess_exec", side_effect=fake):
+            assert await server._ensure_image() is True
+
+        assert server.image_state == "ready"
+        assert len(commands) == 1
+        assert "image inspect" in commands[0]
+
+    @pytest.mark.asyncio
+    async def test_image_missing_is_pulled(self, server):
+        """Si la imagen no existe se ejecuta docker pull."""
+        fake, commands = make_exec_mock(
+            lambda cmd: (1, b"") if "inspect" in cmd else (0, b"")
+        )
+        with patch("asyncio.create_subprocess_exec", side_effect=fake):
+            assert await server._ensure_image() is True
+
+        assert any("docker pull" in cmd for cmd in commands)
+        assert server.image_state == "ready"
+
+    @pytest.mark.asyncio
+    async def test_image_loaded_from_tarball(self, server, tmp_path):
+        """Con tarball configurado la imagen se carga sin red."""
+        import src.server as srv
+        tarball = tmp_path / "nginx.tar"
+        tarball.write_bytes(b"fake")
+        fake, commands = make_exec_mock(
+            lambda cmd: (1, b"") if "inspect" in cmd else (0, b"")
+        )
+        with patch.object(srv, "NGINX_IMAGE_TARBALL", str(tarball)), \
+                patch("asyncio.create_subprocess_exec", side_effect=fake):
+            assert await server._ensure_image() is True
+
+        assert any("docker load" in cmd for cmd in commands)
+        assert not any("docker pull" in cmd for cmd in commands)
+
+    @pytest.mark.asyncio
+    async def test_prewarm_runs_once(self, server):
+        """Varias esperas comparten una sola preparacion."""
+        fake, commands = make_exec_mock(lambda cmd: (0, b""))
+        with patch("asyncio.create_subprocess_exec", side_effect=fake):
+            results = await asyncio.gather(
+                server._ensure_image(), server._ensure_image()
+            )
+
+        assert results == [True, True]
+        assert len(commands) == 1
+
+    @pytest.mark.asyncio
+    async def test_status_reports_image_state(self, server):
+        """server_status informa el estado de la imagen."""
+        server.image_state = "ready"
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"", b""))
+        mock_proc.returncode = 0
+
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            result = await server._server_status({})
+
+        assert "nginx:alpine (ready)" in result[0].text
+
+
+# ============================================================
+# Tests del almacen de estado persistente
+# ============================================================
+
+class TestStateStore:
+    """Tests para el estado persistente (SQLite)."""
+
+    @pytest.mark.asyncio
+    async def test_uses_wal_mode(self, tmp_path):
+        """La base de datos se abre en modo WAL."""
+        store = StateStore(tmp_path / "s.db")
+        await store.flush()
+        mode = await store._submit(
+            lambda: store._db().execute("PRAGMA journal_mode").fetchone()[0]
+        )
+        store.close()
+        assert mode == "wal"
+
+    @pytest.mark.asyncio
+    async def test_state_survives_restart(self, tmp_path):
+        """Un despliegue registrado sigue ahi tras reabrir el almacen."""
+        store = StateStore(tmp_path / "s.db")
+        store.record_deploy("default", tmp_path, CONTAINER_NAME, "abc123", 8080, "nginx:alpine")
+        await store.flush()
+        store.close()
+
+        reopened = StateStore(tmp_path / "s.db")
+        containers = await reopened.containers()
+        reopened.close()
+        assert containers[0]["name"] == CONTAINER_NAME
+        assert containers[0]["port"] == 8080
+        assert containers[0]["status"] == "running"
+
+    @pytest.mark.asyncio
+    async def test_create_html_records_release(self, server, temp_www):
+        """Cada create_html registra una version del contenido."""
+        await server._create_html({"filename": "a.html", "content": "v1"})
+        await server._create_html({"filename": "a.html", "content": "v2"})
+        releases = await server.state.releases()
+        assert [r["size"] for r in releases] == [2, 2]
+        assert releases[0]["sha256"] != releases[1]["sha256"]
+
+    @pytest.mark.asyncio
+    async def test_reconcile_marks_gone_and_adopts(self, server):
+        """La reconciliacion marca desaparecidos y adopta desconocidos."""
+        server.state.record_deploy("default", WWW_DIR, "mcp-web-server-old", "old", 8081, "nginx")
+        output = f"{CONTAINER_NAME}|abc123def456|running|0.0.0.0:8080->80/tcp|nginx:alpine\n"
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(output.encode(), b""))
+        mock_proc.returncode = 0
+
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc) as exec_:
+            assert await server._reconcile_state() is True
+
+        assert exec_.call_count == 1
+        containers = {c["name"]: c for c in await server.state.containers()}
+        assert containers["mcp-web-server-old"]["status"] == "gone"
+        assert containers[CONTAINER_NAME]["status"] == "running"
+        assert containers[CONTAINER_NAME]["port"] == 8080
+
+    @pytest.mark.asyncio
+    async def test_deploy_records_timing(self, server):
+        """deploy_server registra el contenedor y su tiempo."""
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            await server._deploy_server({"port": 8080})
+
+        timings = await server.state.timings("deploy_server")
+        assert len(timings) == 1 and timings[0]["ok"] == 1
+        containers = await server.state.containers()
+        assert containers[0]["container_id"] == "abc123def456"
+
+    @pytest.mark.asyncio
+    async def test_failed_redeploy_frees_stored_port(self, server):
+        """Si 'docker run' falla tras eliminar el contenedor, el almacén no lo da por activo."""
+        run_ok = True
+        fake, _ = make_exec_mock(
+            lambda cmd: (0 if run_ok or not cmd.startswith("docker run") else 1, b"abc123def456789\n")
+        )
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", side_effect=fake):
+            await server._deploy_server({"port": 8080})
+            run_ok = False
+            await server._deploy_server({"port": 8080})
+
+        containers = await server.state.containers()
+        ports = await server.state._submit(
+            lambda: server.state._db().execute("SELECT port FROM ports").fetchall()
+        )
+        assert containers[0]["status"] == "stopped"
+        assert ports == []
+        assert server.ports.port_of(CONTAINER_NAME) is None
+
+    @pytest.mark.asyncio
+    async def test_stop_records_when_rm_fails(self, server):
+        """Un contenedor detenido pero sin eliminar queda como detenido en el almacén."""
+        fake, _ = make_exec_mock(
+            lambda cmd: (1 if cmd.startswith("docker rm ") else 0, b"abc123def456789\n")
+        )
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", side_effect=fake):
+            await server._deploy_server({"port": 8080})
+            await server._stop_server({})
+
+        containers = await server.state.containers()
+        assert containers[0]["status"] == "stopped"
+
+    def test_parse_host_port(self):
+        """Extrae el puerto del host de la salida de docker ps."""
+        assert parse_host_port("0.0.0.0:8080->80/tcp, :::8080->80/tcp") == 8080
+        assert parse_host_port("80/tcp") is None
+
+
+# ============================================================
+# Tests del asignador de puertos
+# ============================================================
+
+class TestPortAllocator:
+    """Tests para la tabla de reservas de puertos."""
+
+    def test_allocates_sequential_free_ports(self):
+        """Sin puerto explicito se asignan puertos distintos del rango."""
+        allocator = PortAllocator(20000, 20010)
+        with patch("src.server.port_is_free", return_value=True):
+            first = allocator.reserve("a")
+            second = allocator.reserve("b")
+        assert (first, second) == (20000, 20001)
+
+    def test_reserved_port_not_handed_twice(self):
+        """Un puerto reservado no se entrega a otro propietario."""
+        allocator = PortAllocator(20000, 20010)
+        with patch("src.server.port_is_free", return_value=True):
+            allocator.reserve("a", 20005)
+            with pytest.raises(PortUnavailableError):
+                allocator.reserve("b", 20005)
+            assert allocator.reserve("a", 20005) == 20005
+
+    def test_skips_ports_busy_on_host(self):
+        """Los puertos ocupados en el host se saltan."""
+        allocator = PortAllocator(20000, 20002)
+        with patch("src.server.port_is_free", side_effect=lambda p: p != 20000):
+            assert allocator.reserve("a") == 20001
+
+    def test_release_returns_port_to_pool(self):
+        """Liberar devuelve el puerto al rango."""
+        allocator = PortAllocator(20000, 20000)
+        with patch("src.server.port_is_free", return_value=True):
+            allocator.reserve("a")
+            with pytest.raises(PortUnavailableError):
+                allocator.reserve("b")
+            assert allocator.release("a") == 20000
+            assert allocator.reserve("b") == 20000
+
+    def test_bind_check_detects_busy_port(self):
+        """port_is_free detecta un puerto escuchando."""
+        import socket
+        from src.server import port_is_free
+        with socket.socket() as sock:
+            sock.bind(("0.0.0.0", 0))
+            sock.listen()
+            assert port_is_free(sock.getsockname()[1]) is False
+
+    def test_bind_check_detects_reuseaddr_listener(self):
+        """Un servidor que escucha con SO_REUSEADDR sigue contando como ocupado."""
+        import socket
+        from src.server import port_is_free
+        with socket.socket() as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("0.0.0.0", 0))
+            sock.listen()
+            assert port_is_free(sock.getsockname()[1]) is False
+
+    @pytest.mark.skipif(os.name == "nt", reason="TIME_WAIT no bloquea el bind en Windows")
+    def test_time_wait_port_is_free(self):
+        """Las conexiones en TIME_WAIT (servidor recién detenido) no ocupan el puerto."""
+        import socket
+        from src.server import port_is_free
+        listener = socket.socket()
+        # Como nginx y docker-proxy: el TIME_WAIT hereda este flag
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(("0.0.0.0", 0))
+        listener.listen()
+        port = listener.getsockname()[1]
+        client = socket.create_connection(("127.0.0.1", port))
+        conn, _ = listener.accept()
+        conn.close()  # cierra primero el servidor: su lado queda en TIME_WAIT
+        client.recv(1)
+        client.close()
+        listener.close()
+        assert port_is_free(port) is True
+
+    @pytest.mark.asyncio
+    async def test_deploy_busy_port_fails_before_docker(self, server):
+        """Un puerto ocupado se rechaza sin llamar a Docker."""
+        with patch("src.server.port_is_free", return_value=False), \
+                patch("asyncio.create_subprocess_exec") as exec_:
+            result = await server._deploy_server({"port": 8080})
+
+        assert "Puerto no disponible" in result[0].text
+        exec_.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_stop_releases_port(self, server):
+        """stop_server libera el puerto reservado."""
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"", b""))
+        mock_proc.returncode = 0
+        server.ports.adopt(CONTAINER_NAME, 8080)
+
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            await server._stop_server({})
+
+        assert server.ports.port_of(CONTAINER_NAME) is None
+
+
+# ============================================================
+# Tests de readiness (servidor HTTP local real)
+# ============================================================
+
+async def start_http_stub(status_line):
+    """Arranca un servidor TCP local que responde con status_line."""
+    async def handle(reader, writer):
+        await reader.readline()
+        writer.write(status_line + b"\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    stub = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return stub, stub.sockets[0].getsockname()[1]
+
+
+class TestReadiness:
+    """Tests para la espera de disponibilidad tras el deploy."""
+
+    @pytest.mark.asyncio
+    async def test_ready_when_http_answers(self):
+        """Un servidor que responde 200 esta listo."""
+        stub, port = await start_http_stub(b"HTTP/1.1 200 OK")
+        async with stub:
+            elapsed = await wait_until_ready(port, "/", timeout=2)
+        assert elapsed is not None and elapsed < 2
+
+    @pytest.mark.asyncio
+    async def test_not_found_counts_as_ready(self):
+        """Un 404 significa que nginx ya sirve."""
+        stub, port = await start_http_stub(b"HTTP/1.1 404 Not Found")
+        async with stub:
+            assert await wait_until_ready(port, "/missing.html", timeout=2) is not None
+
+    @pytest.mark.asyncio
+    async def test_server_error_is_not_ready(self):
+        """Un 5xx no cuenta como listo."""
+        stub, port = await start_http_stub(b"HTTP/1.1 502 Bad Gateway")
+        async with stub:
+            assert await wait_until_ready(port, "/", timeout=0.3) is None
+
+    @pytest.mark.asyncio
+    async def test_closed_port_times_out(self):
+        """Sin nada escuchando se agota el tiempo."""
+        import socket
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        assert await wait_until_ready(port, "/", timeout=0.3) is None
+
+    @pytest.mark.asyncio
+    async def test_deploy_reports_time_to_ready(self, server):
+        """La respuesta del deploy incluye el tiempo hasta estar listo."""
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc) as exec_:
+            result = await server._deploy_server({"port": 8080, "health_path": "/ok.html"})
+
+        assert "Listo en: 50 ms" in result[0].text
+        run_argv = exec_.call_args_list[-1].args
+        assert "--health-cmd" in run_argv
+        assert "/ok.html" in " ".join(run_argv)
+
+    def test_health_check_quotes_url(self):
+        """La URL del HEALTHCHECK va entre comillas para /bin/sh -c."""
+        from src.server import health_check_args
+        args = health_check_args("nginx:alpine", "/?a=1")
+        cmd = args[args.index("--health-cmd") + 1]
+        assert cmd == "wget -q -O /dev/null 'http://127.0.0.1/?a=1' || exit 1"
+
+    def test_health_check_skipped_without_wget(self):
+        """Las imagenes Debian de nginx no traen wget: sin HEALTHCHECK."""
+        from src.server import health_check_args
+        assert health_check_args("nginx:1.27", "/") == []
+        assert health_check_args("registry.local/nginx:1.27-alpine@sha256:abc", "/") != []
+
+    @pytest.mark.asyncio
+    async def test_deploy_not_ready_warns(self, server):
+        """Si nginx no responde a tiempo se avisa en lugar de reportar exito."""
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("src.server.wait_until_ready", AsyncMock(return_value=None)), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            result = await server._deploy_server({"port": 8080, "ready_timeout": 1})
+
+        assert "aún no responde" in result[0].text
+
+    @pytest.mark.asyncio
+    async def test_deploy_rejects_unsafe_health_path(self, server):
+        """Una ruta de salud con caracteres de shell se rechaza."""
+        with patch("asyncio.create_subprocess_exec") as exec_:
+            result = await server._deploy_server({"health_path": "/$(reboot)"})
+        assert "inválida" in result[0].text
+        exec_.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_deploy_rejects_ampersand_health_path(self, server):
+        """'&' lanzaria comandos en segundo plano dentro del HEALTHCHECK."""
+        with patch("asyncio.create_subprocess_exec") as exec_:
+            result = await server._deploy_server({"health_path": "/&touch&/tmp/x"})
+        assert "inválida" in result[0].text
+        exec_.assert_not_called()
+
+
+# ============================================================
+# Tests del ejecutor de comandos
+# ============================================================
+
+class TestCommandExecutor:
+    """Tests para el ejecutor argv multiplataforma (procesos reales)."""
+
+    @pytest.mark.asyncio
+    async def test_captures_structured_output(self):
+        """Captura codigo de salida, stdout y stderr."""
+        result = await CommandExecutor().run([
+            sys.executable, "-c",
+            "import sys; print('hola'); print('aviso', file=sys.stderr); sys.exit(3)"
+        ])
+        assert result.returncode == 3
+        assert result.stdout == "hola"
+        assert result.stderr == "aviso"
+        assert not result.ok
+
+    @pytest.mark.asyncio
+    async def test_arguments_are_not_shell_interpreted(self):
+        """Los argumentos llegan literales, sin pasar por una shell."""
+        result = await CommandExecutor().run([
+            sys.executable, "-c", "import sys; print(sys.argv[1])", "a & b 2>nul"
+        ])
+        assert result.stdout == "a & b 2>nul"
+
+    @pytest.mark.asyncio
+    async def test_timeout_kills_process(self):
+        """Un comando que excede el timeout se cancela."""
+        result = await CommandExecutor(timeout=0.2).run([
+            sys.executable, "-c", "import time; time.sleep(5)"
+        ])
+        assert result.timed_out
+        assert result.duration_ms < 4000
+
+    @pytest.mark.asyncio
+    async def test_missing_executable(self):
+        """Un ejecutable inexistente no lanza excepcion."""
+        result = await CommandExecutor().run(["definitely-not-a-command-xyz"])
+        assert result.returncode == 127
+
+    @pytest.mark.asyncio
+    async def test_run_all_is_concurrent(self):
+        """Los comandos independientes se ejecutan en paralelo."""
+        import time
+        sleeper = [sys.executable, "-c", "import time; time.sleep(0.5)"]
+        started = time.perf_counter()
+        results = await CommandExecutor().run_all(sleeper, sleeper, sleeper)
+        assert all(r.ok for r in results)
+        assert time.perf_counter() - started < 1.4
+
+    def test_docker_volume_path_posix(self, tmp_path):
+        """En Linux/macOS la ruta se pasa tal cual."""
+        if os.name == "nt":
+            pytest.skip("solo POSIX")
+        assert docker_volume_path(tmp_path) == str(tmp_path)
+
+
+# ============================================================
+# Tests de concurrencia (locks, single-flight y semaforo)
+# ============================================================
+
+def make_slow_exec_mock(delay=0.05, stdout=b"abc123def456\n"):
+    """
+    Mock de create_subprocess_exec con comandos que tardan 'delay' segundos.
+
+    Returns:
+        (fake_exec, events, stats): events registra ("start"|"end", cmd) y
+        stats["max"] el maximo de comandos simultaneos
+    """
+    events = []
+    stats = {"running": 0, "max": 0}
+
+    async def fake_exec(*argv, **kwargs):
+        cmd = " ".join(argv)
+
+        async def communicate():
+            events.append(("start", cmd))
+            stats["running"] += 1
+            stats["max"] = max(stats["max"], stats["running"])
+            await asyncio.sleep(delay)
+            stats["running"] -= 1
+            events.append(("end", cmd))
+            return stdout, b""
+
+        proc = MagicMock()
+        proc.communicate = communicate
+        proc.returncode = 0
+        return proc
+
+    return fake_exec, events, stats
+
+
+class TestConcurrency:
+    """Tests del control de concurrencia entre llamadas simultaneas."""
+
+    @pytest.mark.asyncio
+    async def test_executor_bounds_concurrency(self):
+        """El semaforo limita los comandos Docker simultaneos."""
+        fake_exec, events, stats = make_slow_exec_mock()
+        executor = CommandExecutor(concurrency=2)
+        with patch("asyncio.create_subprocess_exec", side_effect=fake_exec):
+            results = await executor.run_all(*(["docker", "ps", str(i)] for i in range(6)))
+        assert all(r.ok for r in results)
+        assert stats["max"] == 2
+
+    @pytest.mark.asyncio
+    async def test_single_flight_coalesces(self):
+        """Llamadas identicas en curso comparten una sola ejecucion."""
+        from src.server import SingleFlight
+        flights, calls = SingleFlight(), []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+        assert results == [1] * 5
+        assert await flights.do("k", work) == 2  # terminada, no se cachea
+
+    @pytest.mark.asyncio
+    async def test_concurrent_status_runs_one_docker_ps(self, server):
+        """Varios server_status simultaneos lanzan un solo 'docker ps'."""
+        fake_exec, events, _ = make_slow_exec_mock(
+            stdout=b"abc123def456|Up 5 minutes|0.0.0.0:8080->80/tcp\n"
+        )
+        with patch("asyncio.create_subprocess_exec", side_effect=fake_exec):
+            results = await asyncio.gather(*(server._server_status({}) for _ in range(5)))
+        assert all("ACTIVO" in r[0].text for r in results)
+        assert len([e for e in events if e[0] == "start"]) == 1
+
+    @pytest.mark.asyncio
+    async def test_deploy_and_stop_do_not_interleave(self, server):
+        """deploy_server y stop_server sobre el mismo contenedor se serializan."""
+        fake_exec, events, _ = make_slow_exec_mock()
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", side_effect=fake_exec):
+            await asyncio.gather(
+                server._deploy_server({"port": 8080}),
+                server._stop_server({}),
+            )
+
+        container_cmds = [
+            cmd for kind, cmd in events
+            if kind == "start" and (f" {CONTAINER_NAME}" in cmd) and "image" not in cmd
+        ]
+        owners = ["deploy" if ("rm -f" in cmd or "docker run" in cmd) else "stop" for cmd in container_cmds]
+        # Todos los comandos de una operacion van seguidos, sin mezclarse
+        assert owners in (["deploy", "deploy", "stop", "stop"], ["stop", "stop", "deploy", "deploy"])
+
+
+# ============================================================
+# Tests de la cache HTTP
+# ============================================================
+
+async def start_recording_stub():
+    """Servidor HTTP local que registra las peticiones recibidas."""
+    requests = []
+
+    async def handle(reader, writer):
+        head = b""
+        while not head.endswith(b"\r\n\r\n"):
+            line = await reader.readline()
+            if not line:
+                break
+            head += line
+        requests.append(head.decode())
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    stub = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return stub, stub.sockets[0].getsockname()[1], requests
+
+
+class TestEdgeCache:
+    """Tests para la cache HTTP delante del sitio."""
+
+    def test_nginx_conf_uses_size_and_ttl(self):
+        """La configuracion generada respeta tamano y TTL."""
+        from src.server import render_nginx_conf
+        conf = render_nginx_conf(128, 300)
+        assert "max_size=128m" in conf
+        assert "proxy_cache_valid 200 301 302 300s" in conf
+        assert "proxy_cache_revalidate on" in conf
+        assert "proxy_cache_bypass $http_x_mcp_purge" in conf
+
+    @pytest.mark.asyncio
+    async def test_deploy_with_cache_mounts_config(self, server, tmp_path):
+        """deploy_server con cache monta la configuracion y un tmpfs."""
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc) as exec_:
+            result = await server._deploy_server(
+                {"port": 8080, "cache": True, "cache_size_mb": 32, "cache_ttl": 120}
+            )
+
+        run_argv = " ".join(exec_.call_args_list[-1].args)
+        assert "/etc/nginx/conf.d/default.conf:ro" in run_argv
+        assert "--tmpfs /var/cache/nginx/edge:rw,size=32m" in run_argv
+        assert (tmp_path / "runtime" / f"{CONTAINER_NAME}.conf").exists()
+        assert "Caché: 32 MB" in result[0].text
+        assert server.sites["default"].cache_port == 8080
+
+    @pytest.mark.asyncio
+    async def test_purge_cache_sends_purge_header(self, server):
+        """purge_cache pide cada ruta con la cabecera de purga."""
+        stub, port, requests = await start_recording_stub()
+        server.sites["default"].cache_port = port
+        async with stub:
+            result = await server._purge_cache({"paths": ["/", "/about.html"]})
+
+        assert "2 rutas" in result[0].text
+        assert len(requests) == 2
+        assert all("X-MCP-Purge: 1" in r for r in requests)
+
+    @pytest.mark.asyncio
+    async def test_create_html_purges_rewritten_page(self, server, temp_www):
+        """Reescribir index.html purga /index.html y /."""
+        stub, port, requests = await start_recording_stub()
+        server.sites["default"].cache_port = port
+        async with stub:
+            result = await server._create_html({"filename": "index.html", "content": "v2"})
+
+        paths = sorted(r.split()[1] for r in requests)
+        assert paths == ["/", "/index.html"]
+        assert "Caché purgada" in result[0].text
+
+    @pytest.mark.asyncio
+    async def test_cache_restored_after_restart(self, server):
+        """Tras reiniciar el servidor, la reconciliacion recupera la cache activa."""
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            await server._deploy_server({"port": 8080, "cache": True})
+        await server.state.flush()
+
+        restarted = WebDeployerServer()
+        try:
+            ps = f"{CONTAINER_NAME}|abc123def456|running|0.0.0.0:8080->80/tcp|nginx:alpine\n"
+            mock_proc.communicate = AsyncMock(return_value=(ps.encode(), b""))
+            with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+                assert await restarted._reconcile_state() is True
+            assert restarted.sites["default"].cache_port == 8080
+        finally:
+            restarted.state.close()
+
+    @pytest.mark.asyncio
+    async def test_no_cache_restored_without_cache_config(self, server):
+        """Un contenedor desplegado sin cache no activa las purgas al reconciliar."""
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            await server._deploy_server({"port": 8080})
+
+        ps = f"{CONTAINER_NAME}|abc123def456|running|0.0.0.0:8080->80/tcp|nginx:alpine\n"
+        mock_proc.communicate = AsyncMock(return_value=(ps.encode(), b""))
+        with patch("asyncio.create_subprocess_exec", return_value=mock_proc):
+            assert await server._reconcile_state() is True
+        assert server.sites["default"].cache_port is None
+
+    @pytest.mark.asyncio
+    async def test_purge_without_cache(self, server):
+        """Sin cache activa se informa en lugar de fallar."""
+        result = await server._purge_cache({})
+        assert "no está activa" in result[0].text
+
+
+# ============================================================
+# Tests de analitica de trafico
+# ============================================================
+
+def log_line(path, status=200, size=100, request_time=0.01, upstream="-", ts=None):
+    """Linea del access log JSON tal como la escribe nginx."""
+    import json, time
+    return json.dumps({
+        "ts": ts if ts is not None else time.time(), "path": path, "status": status,
+        "bytes": size, "request_time": request_time, "upstream_time": upstream, "cache": ""
+    })
+
+
+class TestTrafficAnalytics:
+    """Tests para la ingesta del access log y site_traffic."""
+
+    def test_count_min_sketch_never_underestimates(self):
+        """El sketch da cotas superiores de la frecuencia real."""
+        from src.server import CountMinSketch
+        sketch = CountMinSketch(width=64, depth=4)
+        for i in range(500):
+            sketch.add(f"/page{i % 50}.html")
+        sketch.add("/hot.html", 1000)
+        assert sketch.estimate("/hot.html") >= 1000
+        assert all(sketch.estimate(f"/page{i}.html") >= 10 for i in range(50))
+
+    def test_reservoir_has_fixed_size(self):
+        """El reservorio no crece con el numero de muestras."""
+        from src.server import Reservoir
+        reservoir = Reservoir(size=16)
+        for i in range(10000):
+            reservoir.add(float(i))
+        assert len(reservoir.samples) == 16
+        assert reservoir.seen == 10000
+
+    def test_summary_aggregates_requests(self):
+        """El resumen agrega peticiones, estados, bytes y rutas."""
+        from src.server import TrafficAnalyzer
+        analyzer = TrafficAnalyzer()
+        lines = [log_line("/", size=10) for _ in range(30)]
+        lines += [log_line("/about.html", status=404, size=5) for _ in range(5)]
+        lines += ["no es json", ""]
+        assert analyzer.ingest(lines) == 35
+
+        summary = analyzer.summary(minutes=5)
+        assert summary["requests"] == 35
+        assert summary["bytes"] == 325
+        assert summary["status"] == {200: 30, 404: 5}
+        assert summary["top_paths"][0] == ("/", 30)
+
+    def test_latency_percentiles(self):
+        """Los percentiles salen del reservorio de latencias."""
+        from src.server import TrafficAnalyzer
+        analyzer = TrafficAnalyzer()
+        analyzer.ingest([log_line("/", request_time=t / 1000, upstream=str(t / 1000))
+                         for t in range(1, 101)])
+        summary = analyzer.summary()
+        assert 0.045 <= summary["latency"][0.5] <= 0.055
+        assert summary["upstream_latency"][0.99] >= 0.098
+
+    def test_old_minutes_leave_the_window(self):
+        """Las peticiones fuera de la ventana no cuentan."""
+        import time
+        from src.server import TrafficAnalyzer
+        analyzer = TrafficAnalyzer()
+        analyzer.ingest([log_line("/old", ts=time.time() - 30 * 60), log_line("/new")])
+        assert analyzer.summary(minutes=10)["requests"] == 1
+        assert analyzer.summary(minutes=60)["requests"] == 2
+
+    def test_tailer_reads_only_new_complete_lines(self, tmp_path):
+        """El tailer retorna solo lineas completas y nuevas."""
+        from src.server import AccessLogTailer
+        log = tmp_path / "access.json"
+        log.write_text("a\nb\nparc")
+        tailer = AccessLogTailer(log)
+        assert tailer.read_new() == ["a", "b"]
+        with open(log, "a") as f:
+            f.write("ial\nc\n")
+        assert tailer.read_new() == ["parcial", "c"]
+        log.write_text("d\n")  # truncado
+        assert tailer.read_new() == ["d"]
+
+    @pytest.mark.asyncio
+    async def test_large_log_is_rotated_by_nginx(self, server, tmp_path, monkeypatch):
+        """El host no trunca el log de root: lo rota nginx y no se pierden lineas."""
+        import src.server as srv
+        monkeypatch.setattr(srv, "ACCESS_LOG_MAX_BYTES", 10)
+        monkeypatch.setattr(srv.os, "truncate", MagicMock(side_effect=PermissionError))
+        log_dir = tmp_path / "logs" / CONTAINER_NAME
+        log_dir.mkdir(parents=True)
+        log = log_dir / "access.json"
+        log.write_text(log_line("/a") + "\n")
+        server.ports.adopt(CONTAINER_NAME, 8080)
+
+        def results(cmd):
+            if " mv " in cmd:
+                # Linea escrita justo antes de renombrar
+                with open(log, "a") as f:
+                    f.write(log_line("/late") + "\n")
+                log.rename(log_dir / "access.json.1")
+            return 0, b""
+
+        fake_exec, commands = make_exec_mock(results)
+        rotated = log_dir / "access.json.1"
+        with patch("asyncio.create_subprocess_exec", side_effect=fake_exec):
+            assert await server._ingest_access_log(server.sites["default"]) == 1
+            assert any("kill -s USR1" in cmd for cmd in commands)
+
+            # USR1 solo se envía: los workers siguen escribiendo en .1 hasta reabrir
+            with open(rotated, "a") as f:
+                f.write(log_line("/after-kill") + "\n")
+            assert await server._ingest_access_log(server.sites["default"]) == 2
+            assert sum(" mv " in cmd for cmd in commands) == 1  # .1 sin leer: no se rota otra vez
+            with open(rotated, "a") as f:
+                f.write(log_line("/before-reopen") + "\n")
+            log.write_text(log_line("/b") + "\n")  # nginx reabre el log
+            assert await server._ingest_access_log(server.sites["default"]) == 2
+
+        paths = dict(server.sites["default"].traffic.summary(minutes=5)["top_paths"])
+        assert set(paths) == {"/a", "/late", "/after-kill", "/before-reopen", "/b"}
+
+    @pytest.mark.asyncio
+    async def test_site_traffic_tool(self, server, tmp_path):
+        """site_traffic lee el access log del contenedor."""
+        log_dir = tmp_path / "logs" / CONTAINER_NAME
+        log_dir.mkdir(parents=True)
+        (log_dir / "access.json").write_text(
+            "\n".join([log_line("/index.html")] * 3 + [log_line("/app.js", size=900)]) + "\n"
+        )
+        result = await server._site_traffic({"window_minutes": 5})
+        text = result[0].text
+        assert "Peticiones: 4" in text
+        assert "/index.html (~3)" in text
+
+    @pytest.mark.asyncio
+    async def test_deploy_mounts_access_log(self, server, tmp_path):
+        """El despliegue monta la configuracion con log JSON y el directorio de logs."""
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc) as exec_:
+            await server._deploy_server({"port": 8080})
+
+        run_argv = " ".join(exec_.call_args_list[-1].args)
+        assert ":/var/log/nginx/mcp" in run_argv
+        conf = (tmp_path / "runtime" / f"{CONTAINER_NAME}.conf").read_text()
+        assert "log_format mcp_json escape=json" in conf
+        assert "proxy_cache" not in conf
+
+
+# ============================================================
+# Tests de TLS / HTTP2
+# ============================================================
+
+class TestTls:
+    """Tests para HTTPS con CA local."""
+
+    def test_site_certificate_signed_by_local_ca(self, tmp_path, monkeypatch):
+        """El certificado del sitio lo firma la CA local e incluye localhost."""
+        x509 = pytest.importorskip("cryptography.x509")
+        import src.server as srv
+        monkeypatch.setattr(srv, "CERTS_DIR", tmp_path)
+        site_dir, ca_path = srv.ensure_site_certificate("demo")
+
+        ca = x509.load_pem_x509_certificate(ca_path.read_bytes())
+        cert = x509.load_pem_x509_certificate((site_dir / "site.crt").read_bytes())
+        assert cert.issuer == ca.subject
+        cert.verify_directly_issued_by(ca)
+        san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName)
+        assert "localhost" in san.value.get_values_for_type(x509.DNSName)
+        assert not (site_dir / "ca.key").exists()
+
+    def test_certificate_is_reused(self, tmp_path, monkeypatch):
+        """Un certificado vigente no se regenera."""
+        pytest.importorskip("cryptography")
+        import src.server as srv
+        monkeypatch.setattr(srv, "CERTS_DIR", tmp_path)
+        site_dir, _ = srv.ensure_site_certificate("demo")
+        first = (site_dir / "site.crt").read_bytes()
+        srv.ensure_site_certificate("demo")
+        assert (site_dir / "site.crt").read_bytes() == first
+
+    def test_private_keys_created_owner_only(self, tmp_path, monkeypatch):
+        """Las claves se crean con 0600 aunque el umask sea permisivo."""
+        pytest.importorskip("cryptography")
+        import src.server as srv
+        monkeypatch.setattr(srv, "CERTS_DIR", tmp_path)
+        previous = os.umask(0)
+        try:
+            site_dir, ca_path = srv.ensure_site_certificate("demo")
+        finally:
+            os.umask(previous)
+        assert (site_dir / "site.key").stat().st_mode & 0o777 == 0o600
+        assert (ca_path.parent / "ca.key").stat().st_mode & 0o777 == 0o600
+
+    def test_concurrent_calls_share_one_ca(self, tmp_path, monkeypatch):
+        """Dos despliegues TLS simultáneos no generan dos CAs distintas."""
+        x509 = pytest.importorskip("cryptography.x509")
+        import src.server as srv
+        from concurrent.futures import ThreadPoolExecutor
+        monkeypatch.setattr(srv, "CERTS_DIR", tmp_path)
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(srv.ensure_site_certificate, ["a", "b", "c", "d"]))
+
+        ca = x509.load_pem_x509_certificate(results[0][1].read_bytes())
+        for site_dir, _ in results:
+            cert = x509.load_pem_x509_certificate((site_dir / "site.crt").read_bytes())
+            cert.verify_directly_issued_by(ca)
+
+    def test_nginx_conf_enables_http2_and_session_cache(self):
+        """La configuracion TLS activa HTTP/2 y reanudacion de sesiones."""
+        from src.server import render_nginx_conf
+        conf = render_nginx_conf(tls=True)
+        assert "listen 443 ssl;" in conf and "http2 on;" in conf
+        assert "ssl http2" not in conf
+        assert "ssl_session_cache shared:MCPSSL:10m;" in conf
+        assert "ssl_session_tickets on;" in conf
+        assert "ssl_stapling off;" in conf
+        assert "listen 443" not in render_nginx_conf()
+
+    def test_nginx_conf_shares_cache_between_schemes(self):
+        """Con TLS y cache, :80 y :443 usan la misma clave (una purga vale para ambos)."""
+        from src.server import render_nginx_conf
+        conf = render_nginx_conf(128, 300, tls=True)
+        assert "listen 80;" in conf and "listen 443 ssl;" in conf
+        assert conf.count("proxy_cache_key $proxy_host$request_uri;") == 1
+        assert "$scheme" not in conf
+
+    @pytest.mark.asyncio
+    async def test_deploy_with_tls_publishes_443(self, server, tmp_path):
+        """deploy_server con tls publica 443 y monta solo el certificado del sitio."""
+        pytest.importorskip("cryptography")
+        mock_proc = AsyncMock()
+        mock_proc.communicate = AsyncMock(return_value=(b"abc123def456789\n", b""))
+        mock_proc.returncode = 0
+
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", return_value=mock_proc) as exec_:
+            result = await server._deploy_server({"port": 8080, "tls": True, "tls_port": 8443})
+
+        run_argv = " ".join(exec_.call_args_list[-1].args)
+        assert "8443:443" in run_argv
+        assert f"{tmp_path / 'certs' / CONTAINER_NAME}:/etc/nginx/certs:ro" in run_argv
+        assert "https://localhost:8443" in result[0].text
+        assert server.ports.port_of(f"{CONTAINER_NAME}:tls") == 8443
+
+    @pytest.mark.asyncio
+    async def test_certificate_failure_keeps_previous_container(self, server):
+        """Si el certificado falla, no se elimina el contenedor que ya sirve."""
+        fake, commands = make_exec_mock(lambda cmd: (0, b"abc123def456789\n"))
+        with patch("src.server.port_is_free", return_value=True), \
+                patch("asyncio.create_subprocess_exec", side_effect=fake):
+            await server._deploy_server({"port": 8080})
+            commands.clear()
+            with patch("src.server.ensure_site_certificate",
+                       side_effect=RuntimeError("TLS requiere el paquete 'cryptography'")):
+                result = await server._deploy_server({"port": 8080, "tls": True, "tls_port": 8443})
+
+        assert "cryptography" in result[0].text
+        assert not any(cmd.startswith("docker rm") for cmd in commands)
+        assert not any(cmd.startswith("docker run") for cmd in commands)
+        assert server.ports.port_of(CONTAINER_NAME) == 8080
+        assert server.ports.port_of(f"{CONTAINER_NAME}:tls") is None
+
+    def test_parse_host_port_by_container_port(self):
+        """Distingue el mapeo HTTP del HTTPS."""
+        ports = "0.0.0.0:8443->443/tcp, 0.0.0.0:8080->80/tcp"
+        assert parse_host_port(ports, 80) == 8080
+        assert parse_host_port(ports, 443) == 8443
+
+
 # ============================================================
 # Tests de constantes y configuracion
 # ============================================================
@@ -343,6 +1691,12 @@ class TestConfig:
         from src.server import DEFAULT_PORT
         assert DEFAULT_PORT == 8080
 
+    def test_image_reference_with_digest(self):
+        """Un digest configurado fija la referencia de la imagen."""
+        import src.server as srv
+        with patch.object(srv, "NGINX_IMAGE_DIGEST", "sha256:abc"):
+            assert srv.image_reference() == "nginx:alpine@sha256:abc"
+
     def test_www_dir_is_path(self):
         """WWW_DIR es un objeto Path."""
         assert isinstance(WWW_DIR, Path)